@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api.apps.ApiConfig',
     'rest_framework',
     'django_extensions',
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,14 +98,37 @@ DATABASES = {
     }
 }
 
+# Caching
+# The version counters that invalidate cached recommendations and ETags are kept in the
+# database (api.models.CacheVersion), so a per-process local-memory cache stays correct
+# with several workers. A shared cache (Redis, Memcached) only saves recomputing the
+# same recommendations in every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+RECOMMENDATION_CACHE = os.getenv('RECOMMENDATION_CACHE', 'default')
+RECOMMENDATION_CACHE_TIMEOUT = 3600
+
+AUTH_CACHE = os.getenv('AUTH_CACHE', 'default')
+AUTH_CACHE_TTL = 60
+
+# Requests running more ORM queries than this are logged and counted on /metrics/.
+PROFILING_QUERY_THRESHOLD = 50
+# Adds an X-Query-Count header with each request's ORM query count; meant for local profiling.
+PROFILING_QUERY_HEADER = False
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedBasicAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES':
         ('rest_framework.permissions.IsAuthenticatedOrReadOnly',),
@@ -1,11 +1,14 @@
 from django.contrib import admin
-from .models import Product, Fridge, Recipe, Comment, Rating, Ingredient
+from .models import Product, Fridge, Recipe, Comment, Rating, Ingredient, DailyRollup, CategoryRollup
 from django.contrib.auth.models import User
-from django.db.models.functions import TruncDay
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+import datetime
 import json
 
+CHART_DAYS = 90
+
 # Register your models here.
 
 admin.site.register(Fridge)
@@ -14,6 +17,30 @@ admin.site.register(Rating)
 admin.site.register(Ingredient)
 
 
+def pop_chart_range(request):
+    """
+    Removes ``chart_from``/``chart_to`` from the query string (the changelist rejects
+    unknown parameters) and returns them as dates, defaulting to the last CHART_DAYS.
+    """
+    params = request.GET.copy()
+    dates = []
+    for name in ('chart_from', 'chart_to'):
+        try:
+            dates.append(parse_date(params.pop(name, [''])[-1]))
+        except ValueError:
+            dates.append(None)
+    request.GET = params
+    end = dates[1] or timezone.localdate()
+    start = dates[0] or end - datetime.timedelta(days=CHART_DAYS)
+    return start, end
+
+
+def daily_chart_context(request, metric):
+    start, end = pop_chart_range(request)
+    as_json = json.dumps(DailyRollup.series(metric, start, end), cls=DjangoJSONEncoder)
+    return {"chart_data": as_json, "chart_from": start.isoformat(), "chart_to": end.isoformat()}
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('id', 'product_name', 'category', 'date_added', 'expiration_date')
@@ -21,15 +48,7 @@ class ProductAdmin(admin.ModelAdmin):
     ordering = ("-date_added",)
 
     def changelist_view(self, request, extra_context=None):
-        chart_data = (
-            Product.objects.annotate(date=TruncDay("date_added"))
-                .values("date")
-                .annotate(y=Count("id"))
-                .order_by("-date")
-        )
-
-        as_json = json.dumps(list(chart_data), cls=DjangoJSONEncoder)
-        extra_context = extra_context or {"chart_data": as_json}
+        extra_context = extra_context or daily_chart_context(request, 'products')
 
         return super().changelist_view(request, extra_context=extra_context)
 
@@ -40,20 +59,16 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('difficulty', 'meal')
 
     def changelist_view(self, request, extra_context=None):
-        difficulties = (Recipe.objects.order_by("difficulty").values('difficulty').annotate(count=Count("difficulty")))
-        to_json = {'difficulties': json.dumps(list(difficulties), cls=DjangoJSONEncoder)}
-        to_json['difficulties'] = to_json['difficulties'].replace("BG", "Beginner")
-        to_json['difficulties'] = to_json['difficulties'].replace("IT", "Intermediate")
-        to_json['difficulties'] = to_json['difficulties'].replace("AD", "Advanced")
-        meals = (Recipe.objects.order_by("meal").values('meal').annotate(count=Count("meal")))
-        to_json["meals"] = json.dumps(list(meals), cls=DjangoJSONEncoder)
-        to_json['meals'] = to_json['meals'].replace("BF", "Breakfast")
-        to_json['meals'] = to_json['meals'].replace("LU", "Lunch")
-        to_json['meals'] = to_json['meals'].replace("DN", "Dinner")
-        to_json['meals'] = to_json['meals'].replace("SU", "Supper")
+        rollups = CategoryRollup.objects.filter(metric__in=('difficulty', 'meal'), count__gt=0).order_by('key')
+        labels = {'difficulty': dict(Recipe.DIFFICULTY_CHOICES), 'meal': dict(Recipe.MEAL_CHOICES)}
+        charts = {'difficulty': [], 'meal': []}
+        for rollup in rollups:
+            charts[rollup.metric].append({rollup.metric: labels[rollup.metric].get(rollup.key, rollup.key),
+                                          'count': rollup.count})
+        to_json = {'difficulties': json.dumps(charts['difficulty'], cls=DjangoJSONEncoder),
+                   'meals': json.dumps(charts['meal'], cls=DjangoJSONEncoder)}
 
         extra_context = extra_context or {"chart_data": to_json}
-        print(to_json)
 
         return super().changelist_view(request, extra_context=extra_context)
 
@@ -64,16 +79,7 @@ class UserAdmin(admin.ModelAdmin):
     ordering = ("-date_joined",)
 
     def changelist_view(self, request, extra_context=None):
-        chart_data = (
-            User.objects.annotate(date=TruncDay("date_joined"))
-                .values("date")
-                .annotate(y=Count("id"))
-                .order_by("-date")
-        )
-
-        as_json = json.dumps(list(chart_data), cls=DjangoJSONEncoder)
-        print(as_json)
-        extra_context = extra_context or {"chart_data": as_json}
+        extra_context = extra_context or daily_chart_context(request, 'users')
 
         return super().changelist_view(request, extra_context=extra_context)
 
@@ -1,4 +1,6 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_migrate
 
 
 class ApiConfig(AppConfig):
@@ -6,3 +8,7 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import api.signals
+        from api.metrics import install_query_counter
+        connection_created.connect(install_query_counter)
+        from api.search import enable_trigram_extension
+        pre_migrate.connect(enable_trigram_extension, sender=self)
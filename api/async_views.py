@@ -0,0 +1,87 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .metrics import current_metrics, finish_request, use_metrics
+from .models import Product
+from .pagination import KeysetResultsSetPagination
+from .serializers import ProductSerializer, RecipeSerializer
+from .views import RecipeViewSet, get_expiry_days
+
+
+def database_sync_to_async(function):
+    """
+    Runs ORM work in the thread pool. Each call uses the worker thread's own
+    connection, so concurrent requests do not queue behind a single thread;
+    stale connections are released like at the end of a sync request. The
+    queries count towards the calling request's profiling metrics.
+    """
+    def run(metrics, *args, **kwargs):
+        token = use_metrics(metrics)
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+            finish_request(token)
+
+    pooled = sync_to_async(run, thread_sensitive=False)
+    return lambda *args, **kwargs: pooled(current_metrics(), *args, **kwargs)
+
+
+def authenticate(request):
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def error_response(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def api_view(function):
+    """Authenticates the request and runs ``function`` off the event loop."""
+    async def view(request, *args, **kwargs):
+        drf_request = Request(request)
+        try:
+            data = await database_sync_to_async(handle)(drf_request, *args, **kwargs)
+        except APIException as exc:
+            return error_response(exc.detail, exc.status_code)
+        if data is None:
+            return error_response('Authentication credentials were not provided.', 401)
+        return JsonResponse(data, safe=False)
+
+    def handle(drf_request, *args, **kwargs):
+        user = authenticate(drf_request._request)
+        if user is None:
+            return None
+        drf_request.user = user
+        return function(drf_request, *args, **kwargs)
+
+    return view
+
+
+@api_view
+def notification(request, fridge_id):
+    products = (Product.objects.filter(fridge_id=fridge_id)
+                .expiring_within(get_expiry_days(request))
+                .order_by('expiration_date'))
+    return ProductSerializer(products, many=True).data
+
+
+@api_view
+def fridge_products(request, fridge_id):
+    return ProductSerializer(Product.objects.filter(fridge_id=fridge_id), many=True).data
+
+
+@api_view
+def recipes(request):
+    view = RecipeViewSet(request=request, format_kwarg=None)
+    paginator = KeysetResultsSetPagination()
+    page = paginator.paginate_queryset(view.get_queryset(), request)
+    return {'next': paginator.get_next_link(), 'results': RecipeSerializer(page, many=True).data}
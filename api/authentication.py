@@ -0,0 +1,61 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_CACHE', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'AUTH_CACHE_TTL', 60)
+
+
+def token_cache_key(key):
+    return 'auth:token:{}'.format(key)
+
+
+def invalidate_token(key):
+    get_cache().delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps resolved tokens in the cache for AUTH_CACHE_TTL
+    seconds. Entries are dropped by the Token/User signals in api.signals.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        token = cache.get(token_cache_key(key))
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(token_cache_key(key), token, get_timeout())
+        return token.user, token
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication that skips the password hasher for credentials verified
+    within AUTH_CACHE_TTL seconds. The cache only holds an HMAC of the credentials
+    and the password hash they matched, so a password change invalidates it.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        cache = get_cache()
+        digest = hmac.new(settings.SECRET_KEY.encode(), '{}:{}'.format(userid, password).encode(), hashlib.sha256)
+        cache_key = 'auth:basic:{}'.format(digest.hexdigest())
+        cached = cache.get(cache_key)
+        if cached is not None:
+            user_id, password_hash = cached
+            user = User.objects.filter(pk=user_id, is_active=True).first()
+            if user is not None and user.password == password_hash:
+                return user, None
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(cache_key, (user.pk, user.password), get_timeout())
+        return user, auth
@@ -0,0 +1,156 @@
+import datetime
+import io
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .models import Fridge, Product, Recipe, RecipeIngredient, Rating, Comment
+
+ENDPOINTS = (
+    ('recipes', '/recipes/'),
+    ('recipes_deep_page', '/recipes/?order=pp&page={deep_page}'),
+    ('recipes_cursor', '/recipes/?pagination=cursor'),
+    ('recipes_search', '/recipes/?name=ingredient'),
+    ('recommend', '/profile/recommend/{fridge}'),
+    ('urgent', '/profile/urgent/{fridge}'),
+    ('scored', '/profile/scored/{fridge}'),
+    ('notification', '/notification/{fridge}'),
+    ('fridge_products', '/fridge/{fridge}/'),
+    ('profile_fridges', '/profile/fridges/'),
+)
+
+
+def generate(users=20, fridges=2, products=30, recipes=2000, ratings=5000, comments=3000, vocabulary=300, seed=0):
+    """
+    Fills the database with synthetic users, fridges, products, recipes, ratings
+    and comments, and builds the derived tables the API reads from. Returns the
+    benchmark user (the first one created).
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    names = ['ingredient {}'.format(index) for index in range(vocabulary)]
+    password = make_password(None)
+
+    created_users = User.objects.bulk_create(
+        [User(username='bench{}'.format(index), email='bench{}@example.com'.format(index), password=password)
+         for index in range(users)])
+    created_fridges = Fridge.objects.bulk_create(
+        [Fridge(fridge_name='Fridge {}'.format(index), user_id=user)
+         for user in created_users for index in range(fridges)])
+    Product.objects.bulk_create(
+        [Product(product_name=category.title(), category=category, quantity_g=rng.choice((100, 250, 500, 1000)),
+                 quantity=rng.randint(1, 3), carbohydrates=rng.uniform(0, 60), energy_kcal=rng.randint(20, 600),
+                 fat=rng.uniform(0, 30), fiber=rng.uniform(0, 10), proteins=rng.uniform(0, 25),
+                 salt=rng.uniform(0, 2), sugar=rng.uniform(0, 20), sodium=rng.uniform(0, 1),
+                 date_added=now - datetime.timedelta(days=rng.randint(0, 30)),
+                 expiration_date=now + datetime.timedelta(days=rng.randint(-2, 14)), fridge_id=fridge)
+         for fridge in created_fridges for category in rng.sample(names, min(products, vocabulary))],
+        batch_size=1000)
+
+    recipe_rows = []
+    for index in range(recipes):
+        ingredients = [[name, str(rng.randint(1, 500)), 'g'] for name in rng.sample(names, rng.randint(3, 10))]
+        recipe_rows.append(Recipe(
+            recipe_name='Recipe {} with {}'.format(index, ingredients[0][0]), ingredients=ingredients,
+            ingredients_num=len(ingredients), tags=rng.sample(['quick', 'vegan', 'cheap', 'spicy'], 2),
+            difficulty=rng.choice(Recipe.DIFFICULTY_CHOICES)[0], meal=rng.choice(Recipe.MEAL_CHOICES)[0],
+            prep_time=str(rng.randint(5, 120)), description='', instructions='', image_url=''))
+    created_recipes = Recipe.objects.bulk_create(recipe_rows, batch_size=1000)
+    for start in range(0, len(created_recipes), 1000):
+        RecipeIngredient.rebuild(created_recipes[start:start + 1000])
+
+    pairs = {(rng.randrange(users), rng.randrange(recipes)) for _ in range(ratings)}
+    Rating.objects.bulk_create([Rating(user_id=created_users[user], recipe_id=created_recipes[recipe],
+                                       rating=rng.randint(1, 5)) for user, recipe in pairs], batch_size=1000)
+    Comment.objects.bulk_create(
+        [Comment(author=user, author_name=user.username, date_added=now, content='Benchmark comment',
+                 recipe_id=rng.choice(created_recipes))
+         for user in (rng.choice(created_users) for _ in range(comments))], batch_size=1000)
+    call_command('rebuild_recipe_stats', stdout=io.StringIO())
+    caches['default'].clear()
+    return created_users[0]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def measure(client, url, iterations, cold=False):
+    latencies = []
+    queries = []
+    for _ in range(iterations):
+        if cold:
+            caches['default'].clear()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError('{} returned {}'.format(url, response.status_code))
+        queries.append(len(context.captured_queries))
+
+    tracemalloc.start()
+    client.get(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': statistics.mean(latencies),
+        'queries': max(queries),
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def run(user, iterations=50, cold=False):
+    token, created = Token.objects.get_or_create(user=user)
+    client = Client(HTTP_AUTHORIZATION='Token {}'.format(token.key))
+    fridge = Fridge.objects.filter(user_id=user).values_list('id', flat=True).first()
+    deep_page = max(1, Recipe.objects.count() // 20)
+    results = {}
+    for name, url in ENDPOINTS:
+        url = url.format(fridge=fridge, deep_page=deep_page)
+        client.get(url)
+        results[name] = dict(measure(client, url, iterations, cold), url=url)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Returns a message for each endpoint that got slower or runs more queries than in ``baseline``."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append('{}: p95 {:.1f} ms -> {:.1f} ms'.format(name, previous['p95_ms'], current['p95_ms']))
+        if current['queries'] > previous['queries']:
+            regressions.append('{}: {} -> {} queries'.format(name, previous['queries'], current['queries']))
+        if current['peak_memory_kb'] > previous['peak_memory_kb'] * (1 + tolerance):
+            regressions.append('{}: peak memory {:.0f} KB -> {:.0f} KB'.format(
+                name, previous['peak_memory_kb'], current['peak_memory_kb']))
+    return regressions
+
+
+def save(results, path, parameters):
+    with open(path, 'w') as output:
+        json.dump({'parameters': parameters, 'results': results}, output, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as source:
+        return json.load(source)['results']
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import CacheVersion
+
+CATALOG_VERSION_KEY = 'recipes:catalog:version'
+RECIPES_VERSION_KEY = 'recipes:listing:version'
+HITS_KEY = 'recommendations:hits'
+MISSES_KEY = 'recommendations:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'RECOMMENDATION_CACHE', 'default')]
+
+
+def get_versions(*keys):
+    """Current versions of ``keys`` in one query; a counter that was never bumped reads as 0."""
+    versions = dict(CacheVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    return [versions.get(key, 0) for key in keys]
+
+
+def get_version(key):
+    return get_versions(key)[0]
+
+
+def bump_version(*keys):
+    """
+    Bumps the version counters of ``keys``. The counters are rows updated in the
+    caller's transaction, so a new version becomes visible to other requests and
+    processes together with the writes it stands for, never before them.
+    """
+    # Sorted, so that transactions bumping several counters lock them in the same order.
+    for key in sorted(set(keys)):
+        CacheVersion.bump(key)
+
+
+def fridge_version_key(fridge_id):
+    return 'fridge:{}:version'.format(fridge_id)
+
+
+def fridge_refreshed_key(fridge_id):
+    return 'fridge:{}:refreshed'.format(fridge_id)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def user_fridges_version_key(user_id):
+    return 'user:{}:fridges:version'.format(user_id)
+
+
+def recipe_version_key(recipe_id):
+    return 'recipe:{}:version'.format(recipe_id)
+
+
+def bump_recipe_versions(*recipe_ids):
+    bump_version(RECIPES_VERSION_KEY, *(recipe_version_key(recipe_id) for recipe_id in recipe_ids))
+
+
+def count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def cached_recommendations(kind, fridge_id, compute, *key_parts):
+    """
+    Returns the recipe ids matched for a fridge, calling ``compute`` only when the
+    fridge contents or the recipe catalog changed since the ids were cached. The
+    versions in the key are shared by every process, so a local-memory cache never
+    serves ids from before a write made in another worker.
+    """
+    cache = get_cache()
+    versions = get_versions(fridge_version_key(fridge_id), CATALOG_VERSION_KEY)
+    key = ':'.join(str(part) for part in ['recommendations', kind, fridge_id] + versions + list(key_parts))
+    recipe_ids = cache.get(key)
+    if recipe_ids is None:
+        count(MISSES_KEY)
+        recipe_ids = list(compute())
+        cache.set(key, recipe_ids, getattr(settings, 'RECOMMENDATION_CACHE_TIMEOUT', 3600))
+    else:
+        count(HITS_KEY)
+    return recipe_ids
+
+
+def recommendation_cache_stats():
+    cache = get_cache()
+    return {'hits': cache.get(HITS_KEY, 0), 'misses': cache.get(MISSES_KEY, 0)}
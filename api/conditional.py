@@ -0,0 +1,47 @@
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_versions
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / If-None-Match support to list and retrieve actions.
+
+    The ETag is derived from version counters that are bumped on write (see
+    api.signals and api.cache), read in one query, so a matching request gets a
+    304 before the queryset is evaluated or anything is serialized. Views list the counters they depend on
+    in ``get_version_keys`` and any other inputs in ``get_etag_parts``.
+    """
+    cache_control = 'private, no-cache'
+
+    def get_version_keys(self):
+        raise NotImplementedError
+
+    def get_etag_parts(self):
+        return []
+
+    def get_etag(self, request):
+        parts = [request.user.pk, request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+        parts += get_versions(*self.get_version_keys()) + self.get_etag_parts()
+        return '"{}"'.format(hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Cache-Control'] = self.cache_control
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,52 @@
+import csv
+import json
+from itertools import chain
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() hands the formatted line back to the generator."""
+
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    header = writer.writerow(fields)
+    return chain([header], (writer.writerow([csv_value(row[field]) for field in fields]) for row in rows))
+
+
+def ndjson_lines(rows):
+    return (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+
+
+def get_export_format(request):
+    export_format = request.query_params.get('type', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise ValidationError({'type': 'Expected one of: {}.'.format(', '.join(EXPORT_FORMATS))})
+    return export_format
+
+
+def stream_export(queryset, fields, export_format, filename):
+    """
+    Streams ``queryset`` as CSV or newline-delimited JSON. Rows come from a
+    server-side cursor, so memory use does not depend on the number of rows.
+    """
+    rows = queryset.values(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    lines = csv_lines(rows, fields) if export_format == 'csv' else ndjson_lines(rows)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename, export_format)
+    return response
@@ -0,0 +1,119 @@
+import logging
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from .models import Recipe, RecipeIngredient
+from .search import search_recipes
+
+logger = logging.getLogger(__name__)
+
+
+def annotate_recipe_stats(queryset):
+    # Every recipe gets its stats row when it is created (see api.signals and
+    # import_recipes; rebuild_recipe_stats backfills), so the stats are inner joined
+    # and sorting on them reads the RecipeStats indexes directly.
+    return queryset.filter(stats__isnull=False).annotate(
+        ratings_num=F('stats__ratings_num'),
+        rating=F('stats__rating'),
+        popularity=F('stats__popularity')
+    )
+
+
+def filter_by_ingredients(queryset, ingredients):
+    for name in ingredients.split(','):
+        queryset = queryset.filter(Exists(RecipeIngredient.objects.filter(
+            recipe_id=OuterRef('pk'), ingredient_id__ingredient_name=name.strip().lower())))
+    return queryset
+
+
+class RecipeQuery:
+    """
+    Filtering and ordering shared by every recipe listing.
+
+    Query parameters: ``name``, ``ingredients`` and ``tags`` (comma separated),
+    ``difficulty`` and ``meal`` (choice codes, matched exactly), ``kcal``,
+    ``fat``, ``carbs`` and ``proteins`` bounds (``kcal_min``, ``kcal_max``, ...)
+    over the estimated recipe nutrition and ``order`` (a key of ``order_dict``).
+    Every listing serializes the rating/popularity annotations, so they are always
+    joined in; ordering by a nutrient leaves out recipes without an estimate.
+
+    With ``RECIPE_QUERY_DEBUG = True`` the SQL and its ``EXPLAIN ANALYZE`` plan are
+    logged to ``api.filters``.
+    """
+    order_dict = {'pp': '-popularity', 'na': 'recipe_name', 'nd': '-recipe_name', 'ra': 'rating', 'rd': '-rating',
+                  'pa': 'ratings_num', 'pd': '-ratings_num', 'ta': 'prep_time', 'td': '-prep_time',
+                  'ka': 'energy_kcal', 'kd': '-energy_kcal', 'ga': 'proteins', 'gd': '-proteins'}
+    default_order = 'pp'
+    nutrition_fields = {'energy_kcal', 'fat', 'carbohydrates', 'proteins'}
+    choice_filters = {'difficulty': dict(Recipe.DIFFICULTY_CHOICES), 'meal': dict(Recipe.MEAL_CHOICES)}
+    range_filters = {'kcal': 'energy_kcal', 'fat': 'fat', 'carbs': 'carbohydrates', 'proteins': 'proteins'}
+    # Ties on a stats ordering are broken by the stats row's key, so that the sort and
+    # keyset cursors come straight from the composite (value, recipe_id) indexes.
+    stats_orderings = {'popularity', 'rating', 'ratings_num'}
+
+    def __init__(self, query_params):
+        self.params = query_params
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(request.query_params)
+
+    @property
+    def debug(self):
+        return getattr(settings, 'RECIPE_QUERY_DEBUG', False)
+
+    def get_ordering(self):
+        order = self.params.get('order', None)
+        if order is None and self.params.get('name', None) is not None:
+            return '-similarity'
+        return self.order_dict.get(order, self.order_dict[self.default_order])
+
+    def get_tie_breaker(self, ordering):
+        tie_breaker = 'stats__recipe_id' if ordering.lstrip('-') in self.stats_orderings else 'id'
+        return '-' + tie_breaker if ordering.startswith('-') else tie_breaker
+
+    def filter(self, queryset):
+        recipe_name = self.params.get('name', None)
+        ingredients = self.params.get('ingredients', None)
+        tags = self.params.get('tags', None)
+        if recipe_name is not None:
+            queryset = search_recipes(queryset, recipe_name)
+        if ingredients is not None:
+            queryset = filter_by_ingredients(queryset, ingredients)
+        if tags is not None:
+            queryset = queryset.filter(tags__contains=[tag.strip() for tag in tags.split(',')])
+        for field, choices in self.choice_filters.items():
+            value = self.params.get(field, None)
+            if value is None:
+                continue
+            if value.upper() not in choices:
+                return queryset.none()
+            queryset = queryset.filter(**{field: value.upper()})
+        for param, field in self.range_filters.items():
+            for bound, lookup in (('min', 'gte'), ('max', 'lte')):
+                value = self.params.get('{}_{}'.format(param, bound), None)
+                if value is None:
+                    continue
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise ValidationError({'{}_{}'.format(param, bound): 'A valid number is required.'})
+                queryset = queryset.filter(**{'{}__{}'.format(field, lookup): value})
+        return queryset
+
+    def apply(self, queryset):
+        ordering = self.get_ordering()
+        queryset = annotate_recipe_stats(queryset)
+        if ordering.lstrip('-') in self.nutrition_fields:
+            queryset = queryset.filter(**{ordering.lstrip('-') + '__isnull': False})
+        queryset = self.filter(queryset).order_by(ordering, self.get_tie_breaker(ordering))
+        if self.debug:
+            self.explain(queryset)
+        return queryset
+
+    @staticmethod
+    def explain(queryset):
+        logger.info('Recipe query: %s', queryset.query)
+        logger.info('Recipe query plan:\n%s', queryset.explain(analyze=True))
@@ -0,0 +1,114 @@
+import datetime
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import bump_version, get_cache, get_version, fridge_version_key, \
+    fridge_refreshed_key, user_fridges_version_key
+from .models import Fridge, Product, ArchivedProduct, FridgeNutrition, DailyRollup, WasteEvent, WasteWeekly
+
+WASTE_GRACE_DAYS = 2
+
+
+def fridges_changed(*fridge_ids):
+    """
+    Bookkeeping after products of ``fridge_ids`` were added, changed or removed. The
+    fridge versions are bumped right away; the nutrition summary and the owner's
+    fridge list are refreshed once per fridge after the transaction commits, however
+    many products of it changed.
+    """
+    fridge_ids = sorted(set(fridge_ids) - {None})
+    bump_version(*(fridge_version_key(fridge_id) for fridge_id in fridge_ids))
+    for fridge_id in fridge_ids:
+        transaction.on_commit(partial(refresh_fridge, fridge_id))
+
+
+def refresh_fridge(fridge_id):
+    # Every product change bumps the fridge version first, so one refresh per version is enough.
+    version = get_version(fridge_version_key(fridge_id))
+    cache = get_cache()
+    if cache.get(fridge_refreshed_key(fridge_id)) == version:
+        return
+    cache.set(fridge_refreshed_key(fridge_id), version, None)
+    user_id = Fridge.objects.filter(id=fridge_id).values_list('user_id', flat=True).first()
+    if user_id is None:
+        # Deleted together with its products; the Fridge post_delete handler covered the owner.
+        return
+    FridgeNutrition.refresh(fridge_id, create=False)
+    bump_version(user_fridges_version_key(user_id))
+
+
+def waste_event(product):
+    grams = product.quantity_g * product.quantity
+    return WasteEvent(user_id_id=product.fridge_id.user_id_id, fridge_id=product.fridge_id_id,
+                      product_name=product.product_name, category=product.category, grams=grams,
+                      energy_kcal=product.energy_kcal * grams / 100.0,
+                      expired_on=timezone.localtime(product.expiration_date).date())
+
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def collect_waste(batch_size=500, grace_days=WASTE_GRACE_DAYS):
+    """
+    Moves one batch of products that expired more than ``grace_days`` ago into
+    WasteEvent, adds them to the WasteWeekly aggregates and returns the batch size.
+    Rows are locked with SKIP LOCKED, so several collectors can run at once.
+    """
+    limit = timezone.now() - datetime.timedelta(days=grace_days)
+    with transaction.atomic():
+        products = list(Product.objects.select_for_update(skip_locked=True, of=('self',))
+                        .select_related('fridge_id').filter(expiration_date__lt=limit)
+                        .order_by('expiration_date', 'id')[:batch_size])
+        events = WasteEvent.objects.bulk_create([waste_event(product) for product in products])
+        weeks = defaultdict(lambda: [0, 0.0, 0.0])
+        for event in events:
+            totals = weeks[(event.user_id_id, week_start(event.expired_on), event.category)]
+            totals[0] += 1
+            totals[1] += event.grams
+            totals[2] += event.energy_kcal
+        # Sorted so that concurrent collectors lock the aggregate rows in the same order.
+        for (user_id, week, category), (count, grams, energy_kcal) in sorted(weeks.items()):
+            WasteWeekly.add(user_id, week, category, count, grams, energy_kcal)
+        # A regular delete, so the Product post_delete handlers do their usual bookkeeping.
+        Product.objects.filter(id__in=[product.id for product in products]).delete()
+    return len(products)
+
+
+def archive_products(older_than_days, batch_size=500, grace_days=WASTE_GRACE_DAYS):
+    """
+    Moves one batch of products added more than ``older_than_days`` ago into
+    ArchivedProduct, keeping their ids, and returns the batch size. Products the
+    waste collector is due to pick up are left to it.
+    """
+    now = timezone.now()
+    fields = [field.attname for field in ArchivedProduct._meta.concrete_fields if field.attname != 'archived_at']
+    with transaction.atomic():
+        products = list(Product.objects.select_for_update(skip_locked=True, of=('self',))
+                        .select_related('fridge_id')
+                        .filter(date_added__lt=now - datetime.timedelta(days=older_than_days),
+                                expiration_date__gte=now - datetime.timedelta(days=grace_days))
+                        .order_by('date_added', 'id')[:batch_size])
+        ArchivedProduct.objects.bulk_create([ArchivedProduct(**{field: getattr(product, field) for field in fields})
+                                             for product in products])
+        Product.objects.filter(id__in=[product.id for product in products]).delete()
+        # Archived products still count as added on their day in the admin rollups, so
+        # give back what the post_delete handlers took off.
+        DailyRollup.add_many('products', Counter(timezone.localdate(product.date_added) for product in products))
+    return len(products)
+
+
+def waste_trends(user, weeks=12):
+    """Weekly waste totals of ``user`` over the last ``weeks`` weeks, and the per-category totals of that range."""
+    start = week_start(timezone.localdate()) - datetime.timedelta(weeks=weeks - 1)
+    aggregates = WasteWeekly.objects.filter(user_id=user, week__gte=start)
+    sums = {'products': Sum('events'), 'total_g': Sum('grams'), 'total_kcal': Sum('energy_kcal')}
+    return {
+        'since': start,
+        'weeks': list(aggregates.values('week').annotate(**sums).order_by('week')),
+        'categories': list(aggregates.values('category').annotate(**sums).order_by('-total_g')),
+    }
@@ -0,0 +1,102 @@
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+DEFAULT_FROM_EMAIL = "wasteless.mail@gmail.com"
+
+
+def enqueue_email(subject, body, to, html_body='', from_email=DEFAULT_FROM_EMAIL):
+    return OutboundEmail.objects.create(subject=subject, body=body, html_body=html_body, from_email=from_email,
+                                        to=list(to))
+
+
+def build_message(email, connection):
+    msg = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to, connection=connection)
+    if email.html_body:
+        msg.attach_alternative(email.html_body, "text/html")
+    return msg
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'MAIL_QUEUE_RETRY_DELAY', 30)
+    return datetime.timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def mark_failed(email, error, now):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= getattr(settings, 'MAIL_QUEUE_MAX_ATTEMPTS', 5):
+        email.status = OutboundEmail.FAILED
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def claim_batch(batch_size, now):
+    """
+    Locks up to batch_size due messages with SKIP LOCKED and pushes their
+    next_attempt_at past MAIL_QUEUE_LEASE, so no other worker picks them up while
+    this one sends. The transaction only covers the claim; a worker that dies
+    mid-send leaves its rows queued, and they become due again when the lease runs out.
+    """
+    lease = datetime.timedelta(seconds=getattr(settings, 'MAIL_QUEUE_LEASE', 300))
+    with transaction.atomic():
+        batch = list(OutboundEmail.objects.select_for_update(skip_locked=True)
+                     .filter(status=OutboundEmail.QUEUED, next_attempt_at__lte=now)
+                     .order_by('next_attempt_at')[:batch_size])
+        OutboundEmail.objects.filter(id__in=[email.id for email in batch]).update(next_attempt_at=now + lease)
+    return batch
+
+
+def send_queued_emails(batch_size=50):
+    """
+    Sends one batch of due messages over a single SMTP connection and returns the
+    number of messages sent. Rows are claimed in a short transaction first, so
+    several workers can drain the queue at once without holding locks over SMTP.
+    """
+    now = timezone.now()
+    sent = 0
+    batch = claim_batch(batch_size, now)
+    if not batch:
+        return sent
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        for email in batch:
+            mark_failed(email, error, now)
+        return sent
+
+    try:
+        for email in batch:
+            try:
+                build_message(email, connection).send()
+            except Exception as error:
+                mark_failed(email, error, now)
+                continue
+            email.attempts += 1
+            email.status = OutboundEmail.SENT
+            email.sent_at = timezone.now()
+            email.save(update_fields=['attempts', 'status', 'sent_at'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def queue_metrics():
+    counts = dict(OutboundEmail.objects.values_list('status').annotate(count=Count('id')).order_by())
+    oldest = OutboundEmail.objects.filter(status=OutboundEmail.QUEUED).aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'queued': counts.get(OutboundEmail.QUEUED, 0),
+        'sent': counts.get(OutboundEmail.SENT, 0),
+        'failed': counts.get(OutboundEmail.FAILED, 0),
+        'oldest_queued_age': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
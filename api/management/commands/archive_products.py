@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.lifecycle import archive_products
+
+
+class Command(BaseCommand):
+    help = 'Moves products added long ago out of the live product table into the archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=365, metavar='DAYS',
+                            help='Archive products added more than DAYS days ago.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            archived = archive_products(options['older_than'], batch_size=options['batch_size'])
+            total += archived
+            if archived < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS('Archived {} products'.format(total)))
@@ -0,0 +1,61 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Generates synthetic data in a throwaway test database and measures latency percentiles, query '
+            'counts and peak memory of the API hot paths through the Django test client.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--fridges', type=int, default=2, help='Fridges per user.')
+        parser.add_argument('--products', type=int, default=30, help='Products per fridge.')
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ratings', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=3000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline.')
+        parser.add_argument('--compare', metavar='PATH', help='Baseline to check for regressions.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown, 0.2 = 20%%.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reuse the test database schema; its rows are flushed before generating.')
+
+    def handle(self, *args, **options):
+        parameters = {key: options[key] for key in
+                      ('users', 'fridges', 'products', 'recipes', 'ratings', 'comments', 'seed', 'iterations',
+                       'cold')}
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, keepdb=options['keepdb'])
+        try:
+            if options['keepdb']:
+                # The kept schema still holds the previous run's rows; start from empty tables.
+                call_command('flush', interactive=False, verbosity=0)
+            user = benchmark.generate(users=options['users'], fridges=options['fridges'],
+                                      products=options['products'], recipes=options['recipes'],
+                                      ratings=options['ratings'], comments=options['comments'], seed=options['seed'])
+            results = benchmark.run(user, iterations=options['iterations'], cold=options['cold'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write('{:<20} {:>9} {:>9} {:>9} {:>8} {:>10}'.format(
+            'endpoint', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KB'))
+        for name, result in results.items():
+            self.stdout.write('{:<20} {:>9.1f} {:>9.1f} {:>9.1f} {:>8} {:>10.0f}'.format(
+                name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries'],
+                result['peak_memory_kb']))
+
+        if options['save']:
+            benchmark.save(results, options['save'], parameters)
+        if options['compare']:
+            regressions = benchmark.compare(results, benchmark.load(options['compare']), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against {}:\n{}'.format(options['compare'], '\n'.join(regressions)))
+            self.stdout.write(self.style.SUCCESS('No regressions against {}'.format(options['compare'])))
@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ('/notification/{fridge}', '/fridge/{fridge}/', '/recipes/?pagination=cursor')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Load-tests running servers and reports requests/s and latency percentiles, e.g. the WSGI '
+            'deployment against the ASGI one started with the same number of workers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help='Server to benchmark, e.g. wsgi=http://127.0.0.1:8000. May be repeated.')
+        parser.add_argument('--path', action='append', metavar='PATH',
+                            help='Path to request; {fridge} is replaced with --fridge. Defaults to the polling '
+                                 'endpoints. An "/async" prefix is added for targets named asgi.')
+        parser.add_argument('--fridge', type=int, default=1)
+        parser.add_argument('--token', required=True, help='Auth token sent with every request.')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        paths = options['path'] or DEFAULT_PATHS
+        self.stdout.write('{:<10} {:<40} {:>8} {:>9} {:>9} {:>9} {:>7}'.format(
+            'target', 'path', 'req/s', 'p50 ms', 'p99 ms', 'max ms', 'errors'))
+        for target in options['target']:
+            name, separator, base_url = target.partition('=')
+            if not separator:
+                raise CommandError('--target must look like NAME=URL')
+            for path in paths:
+                if name == 'asgi':
+                    path = '/async' + path
+                url = base_url.rstrip('/') + path.format(fridge=options['fridge'])
+                result = self.run(url, options['token'], options['requests'], options['concurrency'])
+                self.stdout.write('{:<10} {:<40} {:>8.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+                    name, path, result['rps'], result['p50'], result['p99'], result['max'], result['errors']))
+
+    @staticmethod
+    def fetch(url, token):
+        request = Request(url, headers={'Authorization': 'Token {}'.format(token)})
+        started = time.perf_counter()
+        try:
+            with urlopen(request) as response:
+                response.read()
+                ok = response.status < 400
+        except (HTTPError, OSError):
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    def run(self, url, token, requests, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda _: self.fetch(url, token), range(requests)))
+        elapsed = time.perf_counter() - started
+        latencies = [latency for latency, ok in results]
+        return {
+            'rps': requests / elapsed,
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies),
+            'errors': sum(1 for latency, ok in results if not ok),
+        }
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.lifecycle import collect_waste, WASTE_GRACE_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Moves products that expired unused into the waste events and their weekly aggregates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace-days', type=int, default=WASTE_GRACE_DAYS,
+                            help='Days a product may stay past its expiration date before it counts as waste.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for expired products instead of exiting.')
+        parser.add_argument('--interval', type=float, default=3600.0,
+                            help='Seconds to sleep when nothing is left to collect.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            collected = collect_waste(batch_size=options['batch_size'], grace_days=options['grace_days'])
+            total += collected
+            if collected < options['batch_size']:
+                self.stdout.write(self.style.SUCCESS('Collected {} wasted products'.format(total)))
+                if not options['loop']:
+                    break
+                total = 0
+                time.sleep(options['interval'])
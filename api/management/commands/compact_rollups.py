@@ -0,0 +1,57 @@
+import datetime
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.models import Product, ArchivedProduct, Recipe, DailyRollup, CategoryRollup
+
+# Archived products keep counting on the day they were added.
+DAILY_SOURCES = (('products', (Product, ArchivedProduct), 'date_added'), ('users', (User,), 'date_joined'))
+CATEGORY_SOURCES = ('difficulty', 'meal')
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the admin chart rollups from the source tables, correcting any drift of the counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only recompute days from this date (YYYY-MM-DD) on.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since expects a YYYY-MM-DD date')
+
+        for metric, models, field in DAILY_SOURCES:
+            days = Counter()
+            for model in models:
+                queryset = model.objects.all()
+                if since is not None:
+                    start = timezone.make_aware(datetime.datetime.combine(since, datetime.time.min))
+                    queryset = queryset.filter(**{field + '__gte': start})
+                for row in queryset.annotate(day=TruncDate(field)).values('day').annotate(count=Count('id')).order_by():
+                    days[row['day']] += row['count']
+            rollups = [DailyRollup(metric=metric, day=day, count=count) for day, count in days.items()]
+            with transaction.atomic():
+                stale = DailyRollup.objects.filter(metric=metric)
+                if since is not None:
+                    stale = stale.filter(day__gte=since)
+                stale.delete()
+                DailyRollup.objects.bulk_create(rollups, batch_size=1000)
+            self.stdout.write('{}: {} days'.format(metric, len(rollups)))
+
+        for metric in CATEGORY_SOURCES:
+            keys = Recipe.objects.values(metric).annotate(count=Count('id')).order_by()
+            rollups = [CategoryRollup(metric=metric, key=row[metric], count=row['count']) for row in keys]
+            with transaction.atomic():
+                CategoryRollup.objects.filter(metric=metric).delete()
+                CategoryRollup.objects.bulk_create(rollups)
+            self.stdout.write('{}: {} keys'.format(metric, len(rollups)))
+        self.stdout.write(self.style.SUCCESS('Rollups compacted'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_catalog_version, bump_recipe_versions
+from api.nutrition import build_category_table, estimate_recipe_nutrition
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-category product nutrition averages and estimates the nutrition of every recipe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep-categories', action='store_true',
+                            help='Reuse the current category averages instead of recomputing them from products.')
+
+    def handle(self, *args, **options):
+        if not options['keep_categories']:
+            table = build_category_table()
+            self.stdout.write('Averaged nutrition of {} product categories'.format(len(table)))
+        estimated, total = estimate_recipe_nutrition(batch_size=options['batch_size'])
+        bump_catalog_version()
+        bump_recipe_versions()
+        self.stdout.write(self.style.SUCCESS('Estimated nutrition for {} of {} recipes'.format(estimated, total)))
@@ -0,0 +1,121 @@
+import csv
+import json
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import bump_catalog_version, bump_recipe_versions
+from api.models import Recipe, RecipeIngredient, RecipeStats, CategoryRollup
+from api.nutrition import estimate_recipe_nutrition
+
+RECIPE_FIELDS = ('recipe_name', 'ingredients', 'tags', 'difficulty', 'description', 'instructions', 'image_url',
+                 'meal', 'prep_time')
+JSON_FIELDS = ('ingredients', 'tags')
+
+
+class Command(BaseCommand):
+    help = 'Bulk imports recipes from a JSON lines or CSV file and fills the ingredient dictionary.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('jsonl', 'csv'), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--user', help='Username that will own the imported recipes.')
+
+    def handle(self, *args, **options):
+        export_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('User "{}" does not exist'.format(options['user']))
+
+        imported = skipped = 0
+        with open(options['path'], newline='', encoding='utf-8') as source:
+            rows = self.read_csv(source) if export_format == 'csv' else self.read_jsonl(source)
+            batch = []
+            for line, row in enumerate(rows, 1):
+                try:
+                    batch.append(self.build_recipe(row, user))
+                except ValidationError as error:
+                    self.stderr.write('Skipping recipe {}: {}'.format(line, '; '.join(error.messages)))
+                    skipped += 1
+                    continue
+                if len(batch) == options['batch_size']:
+                    saved, dropped = self.save_batch(batch, user)
+                    imported, skipped = imported + saved, skipped + dropped
+                    batch = []
+            saved, dropped = self.save_batch(batch, user)
+            imported, skipped = imported + saved, skipped + dropped
+
+        self.stdout.write(self.style.SUCCESS('Imported {} recipes ({} skipped)'.format(imported, skipped)))
+
+    @staticmethod
+    def read_jsonl(source):
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+    @staticmethod
+    def read_csv(source):
+        for row in csv.DictReader(source):
+            for field in JSON_FIELDS:
+                if row.get(field):
+                    row[field] = json.loads(row[field])
+            yield row
+
+    @staticmethod
+    def build_recipe(row, user):
+        """Builds an unsaved recipe, raising ValidationError for rows the database would reject."""
+        if not row.get('recipe_name'):
+            raise ValidationError('recipe_name is required.')
+        data = {field: row[field] for field in RECIPE_FIELDS if row.get(field) not in (None, '')}
+        ingredients = data.get('ingredients', [])
+        if not isinstance(ingredients, list) or not all(
+                isinstance(item, list) and 0 < len(item) <= 3 and all(isinstance(part, str) for part in item)
+                and item[0] for item in ingredients):
+            raise ValidationError('ingredients must be a list of [name, quantity, unit] lists.')
+        tags = data.get('tags', [])
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            raise ValidationError('tags must be a list of strings.')
+        recipe = Recipe(user_id=user, **data)
+        recipe.ingredients_num = len(recipe.ingredients)
+        # Choices, lengths and array sizes; the text fields are imported blank when missing.
+        recipe.full_clean(exclude=('user_id', 'description', 'instructions', 'image_url'), validate_unique=False)
+        return recipe
+
+    def save_batch(self, recipes, user):
+        """
+        Inserts a batch together with the rows the post_save handlers would have built,
+        in one transaction, and returns the numbers of recipes imported and skipped.
+        Recipes the owner already has under the same name are skipped, so an
+        interrupted import can simply be run again.
+        """
+        existing = set(Recipe.objects.filter(user_id=user, recipe_name__in={recipe.recipe_name for recipe in recipes})
+                       .values_list('recipe_name', flat=True))
+        unique = {}
+        for recipe in recipes:
+            if recipe.recipe_name in existing:
+                self.stderr.write('Skipping recipe "{}": it already exists'.format(recipe.recipe_name))
+            elif recipe.recipe_name in unique:
+                self.stderr.write('Skipping recipe "{}": the name repeats an earlier row'.format(recipe.recipe_name))
+            else:
+                unique[recipe.recipe_name] = recipe
+        skipped = len(recipes) - len(unique)
+        recipes = list(unique.values())
+        if not recipes:
+            return 0, skipped
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes)
+            RecipeIngredient.rebuild(recipes)
+            RecipeStats.objects.bulk_create([RecipeStats.build(recipe.id) for recipe in recipes])
+            CategoryRollup.add_many('difficulty', Counter(recipe.difficulty for recipe in recipes))
+            CategoryRollup.add_many('meal', Counter(recipe.meal for recipe in recipes))
+            estimate_recipe_nutrition(Recipe.objects.filter(id__in=[recipe.id for recipe in recipes]))
+            bump_catalog_version()
+            bump_recipe_versions()
+        return len(recipes), skipped
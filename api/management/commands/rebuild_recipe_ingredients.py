@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = 'Backfills the normalized recipe -> ingredient relation from the Recipe.ingredients arrays.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        count = 0
+        batch = []
+        with transaction.atomic():
+            for recipe in Recipe.objects.all().iterator(chunk_size=batch_size):
+                batch.append(recipe)
+                if len(batch) == batch_size:
+                    count += self.rebuild(batch)
+                    batch = []
+            count += self.rebuild(batch)
+        self.stdout.write(self.style.SUCCESS('Linked ingredients for {} recipes'.format(count)))
+
+    @staticmethod
+    def rebuild(recipes):
+        for recipe in recipes:
+            Recipe.objects.filter(id=recipe.id).update(ingredients_num=len(recipe.ingredients))
+        RecipeIngredient.rebuild(recipes)
+        return len(recipes)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from api.models import Recipe, Rating, Comment, RecipeStats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-recipe rating, comment and popularity statistics from scratch.'
+
+    def handle(self, *args, **options):
+        ratings = {row['recipe_id']: row for row in
+                   Rating.objects.values('recipe_id').annotate(num=Count('id'), total=Sum('rating')).order_by()}
+        comments = {row['recipe_id']: row['num'] for row in
+                    Comment.objects.values('recipe_id').annotate(num=Count('id')).order_by()}
+        stats = []
+        for recipe_id in Recipe.objects.values_list('id', flat=True).iterator():
+            rated = ratings.get(recipe_id, {})
+            stats.append(RecipeStats.build(recipe_id, ratings_num=rated.get('num', 0),
+                                           ratings_sum=rated.get('total', 0),
+                                           comments_num=comments.get(recipe_id, 0)))
+        with transaction.atomic():
+            RecipeStats.objects.all().delete()
+            RecipeStats.objects.bulk_create(stats, batch_size=1000)
+        self.stdout.write(self.style.SUCCESS('Rebuilt statistics for {} recipes'.format(len(stats))))
@@ -0,0 +1,67 @@
+from itertools import groupby
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from api.models import Product, ExpiryDigestRun
+
+
+class Command(BaseCommand):
+    help = 'Sends one digest email per user listing the products that expire soon.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=3)
+        parser.add_argument('--restart', action='store_true', help="Ignore today's checkpoint and start over.")
+
+    def handle(self, *args, **options):
+        run, created = ExpiryDigestRun.objects.get_or_create(run_date=timezone.localdate())
+        if options['restart']:
+            run.last_user_id = 0
+            run.finished = False
+        elif run.finished:
+            self.stdout.write('Digests for {} were already sent'.format(run.run_date))
+            return
+
+        products = (Product.objects.expiring_within(options['days'])
+                    .filter(fridge_id__user_id__gt=run.last_user_id)
+                    .exclude(fridge_id__user_id__email='')
+                    .select_related('fridge_id__user_id')
+                    .order_by('fridge_id__user_id', 'expiration_date'))
+
+        sent = 0
+        connection = get_connection()
+        connection.open()
+        try:
+            for user, user_products in groupby(products.iterator(), key=lambda product: product.fridge_id.user_id):
+                self.build_message(user, list(user_products), connection).send()
+                run.last_user_id = user.id
+                run.save(update_fields=['last_user_id', 'finished'])
+                sent += 1
+        finally:
+            connection.close()
+
+        run.finished = True
+        run.save(update_fields=['last_user_id', 'finished'])
+        self.stdout.write(self.style.SUCCESS('Sent {} expiry digests'.format(sent)))
+
+    @staticmethod
+    def build_message(user, products, connection):
+        context = {
+            'username': user.username,
+            'products': products,
+        }
+
+        email_html = render_to_string('email/expiry_digest.html', context)
+        email_plaintext = render_to_string('email/expiry_digest.txt', context)
+
+        msg = EmailMultiAlternatives(
+            "Products expiring soon in {title}".format(title="Wasteless"),
+            email_plaintext,
+            "wasteless.mail@gmail.com",
+            [user.email],
+            connection=connection
+        )
+        msg.attach_alternative(email_html, "text/html")
+        return msg
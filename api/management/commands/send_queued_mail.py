@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.mail import send_queued_emails, queue_metrics
+
+
+class Command(BaseCommand):
+    help = 'Sends queued outbound emails in batches, optionally as a long-running worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_emails(batch_size=options['batch_size'])
+            if sent:
+                self.stdout.write('Sent {} emails, queue: {}'.format(sent, queue_metrics()))
+            if not options['loop']:
+                break
+            if sent < options['batch_size']:
+                time.sleep(options['interval'])
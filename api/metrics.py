@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+
+class RouteStats:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.latency = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.flagged = 0
+
+
+class Registry:
+    """
+    In-process store of per-route request statistics. Every worker process keeps
+    its own numbers, so Prometheus should scrape each worker (or sum across them).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(RouteStats)
+
+    def observe(self, method, route, latency, metrics, flagged):
+        with self.lock:
+            stats = self.routes[(method, route)]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.buckets[index] += 1
+            stats.count += 1
+            stats.latency += latency
+            stats.queries += metrics.queries
+            stats.db_time += metrics.db_time
+            stats.serializer_time += metrics.serializer_time
+            stats.flagged += int(flagged)
+
+    def render(self):
+        lines = [
+            '# HELP wasteless_request_duration_seconds Request latency per route.',
+            '# TYPE wasteless_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            routes = sorted(self.routes.items())
+            for (method, route), stats in routes:
+                labels = 'method="{}",route="{}"'.format(method, route.replace('"', '\\"'))
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append('wasteless_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                        labels, bound, count))
+                lines.append('wasteless_request_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                    labels, stats.count))
+                lines.append('wasteless_request_duration_seconds_sum{{{}}} {}'.format(labels, stats.latency))
+                lines.append('wasteless_request_duration_seconds_count{{{}}} {}'.format(labels, stats.count))
+            for name, help_text, attribute in (
+                    ('wasteless_request_queries_total', 'ORM queries executed per route.', 'queries'),
+                    ('wasteless_request_db_seconds_total', 'Time spent in the database per route.', 'db_time'),
+                    ('wasteless_request_serializer_seconds_total', 'Time spent serializing per route.',
+                     'serializer_time'),
+                    ('wasteless_request_query_threshold_exceeded_total',
+                     'Requests above PROFILING_QUERY_THRESHOLD queries.', 'flagged')):
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} counter'.format(name))
+                for (method, route), stats in routes:
+                    lines.append('{}{{method="{}",route="{}"}} {}'.format(
+                        name, method, route.replace('"', '\\"'), getattr(stats, attribute)))
+        return lines
+
+
+registry = Registry()
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def use_metrics(metrics):
+    """Counts the current thread's work towards ``metrics``; returns a token for finish_request()."""
+    return _current.set(metrics)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    connection_created receiver. Every thread has its own connection, so the wrapper
+    goes on each of them and counts towards whichever request runs in that thread,
+    including the ORM work async views hand to the thread pool.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializer_timer():
+    metrics = _current.get()
+    if metrics is None or metrics.serializer_depth:
+        yield
+        return
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        metrics.serializer_time += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """Adds the time spent in to_representation() to the current request's metrics."""
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+def gauge(name, help_text, value):
+    return ['# HELP {} {}'.format(name, help_text), '# TYPE {} gauge'.format(name), '{} {}'.format(name, value)]
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from .metrics import registry, start_request, finish_request
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """
+    Records latency, ORM query count, database time and serializer time per
+    route, and flags requests that run more than PROFILING_QUERY_THRESHOLD
+    queries. The numbers are served in Prometheus format by api.views.Metrics.
+
+    The middleware works in both modes, so under ASGI it does not force the
+    async views onto the single thread Django keeps for sync code. Queries are
+    counted by the wrapper api.metrics.install_query_counter puts on every
+    connection, whichever thread runs them.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'PROFILING_QUERY_THRESHOLD', 50)
+        self.query_header = getattr(settings, 'PROFILING_QUERY_HEADER', False)
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Lets Django see this instance as a coroutine function, like MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics, token = start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request(token)
+        return self.process_metrics(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics, token = start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request(token)
+        return self.process_metrics(request, response, metrics, time.perf_counter() - started)
+
+    def process_metrics(self, request, response, metrics, latency):
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        flagged = metrics.queries > self.threshold
+        if flagged:
+            logger.warning('%s %s ran %d queries (threshold %d) in %.1f ms',
+                           request.method, request.path, metrics.queries, self.threshold, latency * 1000)
+        registry.observe(request.method, route, latency, metrics, flagged)
+        if self.query_header:
+            response['X-Query-Count'] = str(metrics.queries)
+        return response
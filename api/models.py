@@ -1,6 +1,13 @@
+import datetime
+import time
+
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models import F, Case, When, Value, FloatField, Count, Sum, ExpressionWrapper
+from django.db.models.functions import Cast
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 
 # Create your models here.
@@ -22,7 +29,35 @@ class LowerCharField(models.CharField):
         return str(value).lower()
 
 
-class Product(models.Model):
+NUTRIENTS = ('energy_kcal', 'fat', 'carbohydrates', 'proteins', 'fiber', 'sugar', 'salt', 'sodium')
+
+
+class ProductQuerySet(models.QuerySet):
+    def expiring_within(self, days):
+        limit = datetime.datetime.combine(timezone.localdate() + datetime.timedelta(days=days), datetime.time.min)
+        return self.filter(expiration_date__lt=timezone.make_aware(limit))
+
+    def nutrition(self):
+        """
+        Nutrient totals of the products, overall and per category, in one GROUP BY.
+        Nutrients are stored per 100 g, so each is scaled by quantity_g * quantity / 100.
+        """
+        grams = ExpressionWrapper(F('quantity_g') * F('quantity'), output_field=FloatField())
+        amounts = {name: Sum(ExpressionWrapper(F(name) * F('quantity_g') * F('quantity') / 100.0,
+                                               output_field=FloatField())) for name in NUTRIENTS}
+        rows = self.values('category').annotate(products=Count('id'), grams=Sum(grams), **amounts).order_by('category')
+        totals = dict.fromkeys(('products', 'grams') + NUTRIENTS, 0)
+        categories = []
+        for row in rows:
+            for key in totals:
+                totals[key] += row[key] or 0
+            categories.append({key: round(value, 2) if isinstance(value, float) else value
+                               for key, value in row.items()})
+        totals = {key: round(value, 2) if isinstance(value, float) else value for key, value in totals.items()}
+        return {'totals': totals, 'categories': categories}
+
+
+class BaseProduct(models.Model):
     product_name = models.CharField(max_length=150)
     category = LowerCharField(max_length=150, default="None")
     quantity_g = models.FloatField()
@@ -38,18 +73,91 @@ class Product(models.Model):
     image_url = models.CharField(max_length=200, blank=True)
     date_added = models.DateTimeField()
     expiration_date = models.DateTimeField()
-    fridge_id = models.ForeignKey(Fridge, related_name='products', on_delete=models.CASCADE)
+
+    class Meta:
+        abstract = True
 
     def __str__(self):
         return self.product_name
 
 
+class Product(BaseProduct):
+    fridge_id = models.ForeignKey(Fridge, related_name='products', on_delete=models.CASCADE)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['fridge_id', 'expiration_date']), models.Index(fields=['expiration_date'])]
+
+
+class ArchivedProduct(BaseProduct):
+    """A product moved out of the live table by the archive_products command; keeps the product's id."""
+    fridge_id = models.ForeignKey(Fridge, related_name='archived_products', on_delete=models.CASCADE)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['fridge_id', 'date_added'])]
+
+
+class FridgeNutrition(models.Model):
+    fridge_id = models.OneToOneField(Fridge, related_name='nutrition', on_delete=models.CASCADE, primary_key=True)
+    totals = models.JSONField(default=dict)
+    categories = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.fridge_id_id)
+
+    @classmethod
+    def refresh(cls, fridge_id, create=True):
+        """
+        Recomputes the summary of a fridge. With ``create=False`` only an existing row
+        is updated, which is what product writes use, so that a fridge being deleted
+        never gets a fresh summary row inserted by its cascading product deletes.
+        """
+        summary = Product.objects.filter(fridge_id=fridge_id).nutrition()
+        if not create:
+            cls.objects.filter(fridge_id=fridge_id).update(updated_at=timezone.now(), **summary)
+            return None
+        return cls.objects.update_or_create(fridge_id_id=fridge_id, defaults=summary)[0]
+
+
 class Ingredient(models.Model):
     ingredient_name = LowerCharField(max_length=150, unique=True)
 
+    class Meta:
+        indexes = [GinIndex(fields=['ingredient_name'], name='ingredient_name_trgm', opclasses=['gin_trgm_ops'])]
+
     def __str__(self):
         return self.ingredient_name
 
+    @classmethod
+    def resolve(cls, names):
+        names = {name.lower() for name in names}
+        cls.objects.bulk_create([cls(ingredient_name=name) for name in names], batch_size=1000,
+                                ignore_conflicts=True)
+        return dict(cls.objects.filter(ingredient_name__in=names).values_list('ingredient_name', 'id'))
+
+
+class CategoryNutrition(models.Model):
+    """Average nutrients per 100 g, and average item weight, of the products of a category."""
+    category = LowerCharField(max_length=150, unique=True)
+    products = models.IntegerField(default=0)
+    item_g = models.FloatField(default=0.0)
+    energy_kcal = models.FloatField(default=0.0)
+    fat = models.FloatField(default=0.0)
+    carbohydrates = models.FloatField(default=0.0)
+    proteins = models.FloatField(default=0.0)
+    fiber = models.FloatField(default=0.0)
+    sugar = models.FloatField(default=0.0)
+    salt = models.FloatField(default=0.0)
+    sodium = models.FloatField(default=0.0)
+
+    def __str__(self):
+        return self.category
+
 
 class Recipe(models.Model):
     user_id = models.ForeignKey('auth.User', related_name='recipes', on_delete=models.CASCADE, null=True)
@@ -69,11 +177,59 @@ class Recipe(models.Model):
     MEAL_CHOICES = [('BF', 'Breakfast'), ('LU', 'Lunch'), ('DN', 'Dinner'), ('SU', 'Supper')]
     meal = models.CharField(max_length=2, choices=MEAL_CHOICES, default='BF')
     prep_time = models.CharField(max_length=50, blank=True)
+    ingredients_num = models.IntegerField(default=0, db_index=True)
+    # Estimated nutrients of the whole recipe, filled in by api.nutrition.
+    energy_kcal = models.FloatField(null=True, blank=True, db_index=True)
+    fat = models.FloatField(null=True, blank=True, db_index=True)
+    carbohydrates = models.FloatField(null=True, blank=True, db_index=True)
+    proteins = models.FloatField(null=True, blank=True, db_index=True)
+    fiber = models.FloatField(null=True, blank=True)
+    sugar = models.FloatField(null=True, blank=True)
+    salt = models.FloatField(null=True, blank=True)
+    sodium = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [GinIndex(fields=['recipe_name'], name='recipe_name_trgm', opclasses=['gin_trgm_ops'])]
 
     def __str__(self):
         return self.recipe_name
 
 
+class RecipeIngredient(models.Model):
+    recipe_id = models.ForeignKey(Recipe, related_name='recipe_ingredients', on_delete=models.CASCADE)
+    ingredient_id = models.ForeignKey(Ingredient, related_name='recipe_ingredients', on_delete=models.CASCADE)
+    quantity = models.CharField(max_length=50, blank=True)
+    unit = models.CharField(max_length=50, blank=True)
+    position = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ('position',)
+        indexes = [models.Index(fields=['ingredient_id', 'recipe_id'])]
+
+    def __str__(self):
+        return str(self.ingredient_id)
+
+    @classmethod
+    def rebuild(cls, recipes):
+        recipes = list(recipes)
+        cls.objects.filter(recipe_id__in=recipes).delete()
+        ingredient_ids = Ingredient.resolve(row[0] for recipe in recipes for row in recipe.ingredients if row and row[0])
+        links = []
+        for recipe in recipes:
+            for position, row in enumerate(row for row in recipe.ingredients if row and row[0]):
+                links.append(cls(recipe_id=recipe, ingredient_id_id=ingredient_ids[row[0].lower()],
+                                 quantity=row[1] if len(row) > 1 else '', unit=row[2] if len(row) > 2 else '',
+                                 position=position))
+        cls.objects.bulk_create(links, batch_size=1000)
+
+    @classmethod
+    def recipe_hits(cls, ingredient_names):
+        return (cls.objects.filter(ingredient_id__ingredient_name__in=set(ingredient_names))
+                .values('recipe_id', 'recipe_id__ingredients_num')
+                .annotate(hits=models.Count('ingredient_id', distinct=True))
+                .order_by())
+
+
 class Comment(models.Model):
     author = models.ForeignKey('auth.User', related_name='comments', on_delete=models.CASCADE)
     author_name = models.CharField(max_length=100)
@@ -92,3 +248,196 @@ class Rating(models.Model):
 
     def __str__(self):
         return self.id
+
+
+class RecipeStats(models.Model):
+    recipe_id = models.OneToOneField(Recipe, related_name='stats', on_delete=models.CASCADE, primary_key=True)
+    ratings_num = models.IntegerField(default=0)
+    ratings_sum = models.IntegerField(default=0)
+    comments_num = models.IntegerField(default=0)
+    rating = models.FloatField(default=0.0)
+    popularity = models.FloatField(default=0.0)
+
+    class Meta:
+        # One per sortable stat, matching the (value, recipe_id) order of the recipe listings.
+        indexes = [models.Index(fields=['popularity', 'recipe_id']), models.Index(fields=['rating', 'recipe_id']),
+                   models.Index(fields=['ratings_num', 'recipe_id'])]
+
+    def __str__(self):
+        return str(self.recipe_id_id)
+
+    @classmethod
+    def build(cls, recipe_id, ratings_num=0, ratings_sum=0, comments_num=0):
+        rating = ratings_sum / ratings_num if ratings_num else 0.0
+        popularity = ratings_num * (rating if ratings_num else 1) ** 2 + comments_num - ratings_num
+        return cls(recipe_id_id=recipe_id, ratings_num=ratings_num, ratings_sum=ratings_sum,
+                   comments_num=comments_num, rating=rating, popularity=popularity)
+
+    @classmethod
+    def apply(cls, recipe_id, ratings_num=0, ratings_sum=0, comments_num=0):
+        stats = cls.objects.filter(recipe_id=recipe_id)
+        stats.update(ratings_num=F('ratings_num') + ratings_num, ratings_sum=F('ratings_sum') + ratings_sum,
+                     comments_num=F('comments_num') + comments_num)
+        # Second statement so that the derived columns see the incremented counters.
+        stats.update(
+            rating=Case(When(ratings_num=0, then=Value(0.0)),
+                        default=Cast('ratings_sum', FloatField()) / Cast('ratings_num', FloatField())),
+            popularity=Case(When(ratings_num=0, then=Cast('comments_num', FloatField())),
+                            default=Cast(F('ratings_sum') * F('ratings_sum'), FloatField()) / Cast('ratings_num',
+                                                                                                  FloatField())
+                            + Cast(F('comments_num') - F('ratings_num'), FloatField()))
+        )
+
+
+class ExpiryDigestRun(models.Model):
+    run_date = models.DateField(unique=True)
+    last_user_id = models.IntegerField(default=0)
+    finished = models.BooleanField(default=False)
+
+    def __str__(self):
+        return str(self.run_date)
+
+
+class OutboundEmail(models.Model):
+    QUEUED = 'QU'
+    SENT = 'SE'
+    FAILED = 'FA'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (SENT, 'Sent'), (FAILED, 'Failed')]
+    status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=QUEUED)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = ArrayField(models.CharField(max_length=254))
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return self.subject
+
+
+class DailyRollup(models.Model):
+    metric = models.CharField(max_length=50)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('metric', 'day')
+
+    def __str__(self):
+        return '{} {}'.format(self.metric, self.day)
+
+    @classmethod
+    def add(cls, metric, day, amount=1):
+        if not cls.objects.filter(metric=metric, day=day).update(count=F('count') + amount):
+            rollup, created = cls.objects.get_or_create(metric=metric, day=day, defaults={'count': amount})
+            if not created:
+                cls.objects.filter(pk=rollup.pk).update(count=F('count') + amount)
+
+    @classmethod
+    def add_many(cls, metric, amounts):
+        for day, amount in amounts.items():
+            if amount:
+                cls.add(metric, day, amount)
+
+    @classmethod
+    def series(cls, metric, start, end):
+        return [{'date': day, 'y': count} for day, count in
+                cls.objects.filter(metric=metric, day__range=(start, end)).order_by('-day').values_list('day',
+                                                                                                       'count')]
+
+
+class CategoryRollup(models.Model):
+    metric = models.CharField(max_length=50)
+    key = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('metric', 'key')
+
+    def __str__(self):
+        return '{} {}'.format(self.metric, self.key)
+
+    @classmethod
+    def add(cls, metric, key, amount=1):
+        if not cls.objects.filter(metric=metric, key=key).update(count=F('count') + amount):
+            rollup, created = cls.objects.get_or_create(metric=metric, key=key, defaults={'count': amount})
+            if not created:
+                cls.objects.filter(pk=rollup.pk).update(count=F('count') + amount)
+
+    @classmethod
+    def add_many(cls, metric, amounts):
+        for key, amount in amounts.items():
+            if amount:
+                cls.add(metric, key, amount)
+
+
+class WasteEvent(models.Model):
+    """A product that expired unused, moved out of the Product table by api.lifecycle."""
+    user_id = models.ForeignKey('auth.User', related_name='waste_events', on_delete=models.CASCADE)
+    fridge_id = models.IntegerField()
+    product_name = models.CharField(max_length=150)
+    category = LowerCharField(max_length=150, default="None")
+    grams = models.FloatField()
+    energy_kcal = models.FloatField()
+    expired_on = models.DateField()
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user_id', 'expired_on'])]
+
+    def __str__(self):
+        return self.product_name
+
+
+class WasteWeekly(models.Model):
+    user_id = models.ForeignKey('auth.User', related_name='waste_weeks', on_delete=models.CASCADE)
+    week = models.DateField()
+    category = LowerCharField(max_length=150, default="None")
+    events = models.IntegerField(default=0)
+    grams = models.FloatField(default=0.0)
+    energy_kcal = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('user_id', 'week', 'category')
+
+    def __str__(self):
+        return '{} {}'.format(self.week, self.category)
+
+    @classmethod
+    def add(cls, user_id, week, category, events, grams, energy_kcal):
+        increments = {'events': F('events') + events, 'grams': F('grams') + grams,
+                      'energy_kcal': F('energy_kcal') + energy_kcal}
+        if not cls.objects.filter(user_id=user_id, week=week, category=category).update(**increments):
+            weekly, created = cls.objects.get_or_create(
+                user_id_id=user_id, week=week, category=category,
+                defaults={'events': events, 'grams': grams, 'energy_kcal': energy_kcal})
+            if not created:
+                cls.objects.filter(pk=weekly.pk).update(**increments)
+
+
+class CacheVersion(models.Model):
+    """
+    Version counter behind the ETags and cached recommendations of api.cache. It lives
+    in the database so that every process sees a bump, and only once the write that
+    caused it has committed.
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return self.key
+
+    @classmethod
+    def bump(cls, key):
+        if not cls.objects.filter(key=key).update(version=F('version') + 1):
+            # Start from the clock so that a recreated counter never reuses an old version.
+            counter, created = cls.objects.get_or_create(key=key, defaults={'version': int(time.time() * 1000)})
+            if not created:
+                cls.objects.filter(key=key).update(version=F('version') + 1)
@@ -0,0 +1,128 @@
+import re
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from .models import NUTRIENTS, CategoryNutrition, Product, Recipe, RecipeIngredient
+
+UNIT_GRAMS = {
+    'g': 1.0, 'gr': 1.0, 'gram': 1.0, 'grams': 1.0, 'dag': 10.0, 'kg': 1000.0, 'mg': 0.001,
+    'ml': 1.0, 'cl': 10.0, 'dl': 100.0, 'l': 1000.0,
+    'tsp': 5.0, 'teaspoon': 5.0, 'teaspoons': 5.0, 'tbsp': 15.0, 'tablespoon': 15.0, 'tablespoons': 15.0,
+    'cup': 240.0, 'cups': 240.0, 'oz': 28.35, 'lb': 453.6, 'pinch': 0.5,
+}
+QUANTITY_RE = re.compile(r'\d+(?:[.,]\d+)?(?:\s*/\s*\d+)?')
+WORD_RE = re.compile(r'[^\W\d_]+')
+
+
+def parse_amount(token):
+    token = token.replace(',', '.').replace(' ', '')
+    if '/' in token:
+        numerator, denominator = token.split('/')
+        return float(numerator) / float(denominator) if float(denominator) else np.nan
+    return float(token)
+
+
+def parse_quantity(text):
+    """First amount in a quantity such as '2', '1.5', '1,5', '1/2', '1 1/2' or '2-3'; NaN if there is none."""
+    tokens = QUANTITY_RE.findall(text or '')
+    if not tokens:
+        return np.nan
+    value = parse_amount(tokens[0])
+    if len(tokens) > 1 and '/' in tokens[1] and '/' not in tokens[0]:
+        value += parse_amount(tokens[1])
+    return value
+
+
+def unit_grams(unit):
+    """Grams per unit (millilitres count as grams); NaN for pieces and unknown units."""
+    return UNIT_GRAMS.get((unit or '').strip().lower().rstrip('.'), np.nan)
+
+
+def match_category(name, categories):
+    """
+    Index of the product category an ingredient name refers to: the whole name, or
+    else its last word that names a category (also without a plural ending); -1 if none.
+    """
+    name = name.lower()
+    if name in categories:
+        return categories[name]
+    for word in reversed(WORD_RE.findall(name)):
+        for candidate in (word, word[:-1] if word.endswith('s') else None, word[:-2] if word.endswith('es') else None):
+            if candidate in categories:
+                return categories[candidate]
+    return -1
+
+
+def build_category_table():
+    """Replaces CategoryNutrition with the per-category averages of the current products."""
+    averages = {name: Avg(name) for name in NUTRIENTS}
+    rows = (Product.objects.exclude(category='none').values('category')
+            .annotate(products=Count('id'), item_g=Avg('quantity_g'), **averages).order_by())
+    table = [CategoryNutrition(**row) for row in rows]
+    with transaction.atomic():
+        CategoryNutrition.objects.all().delete()
+        CategoryNutrition.objects.bulk_create(table, batch_size=1000)
+    return table
+
+
+def estimate(recipes):
+    """
+    Estimates the nutrients of ``recipes`` (a queryset) in one vectorized pass over
+    their ingredient rows. Every ingredient matched to a category contributes its
+    amount in grams times the category's nutrients per 100 g; pieces and unknown
+    units are weighed at the category's average item weight, and a missing amount
+    counts as one. Returns (recipe_ids, totals, estimated) where ``estimated`` marks
+    the recipes with at least one matched ingredient.
+    """
+    table = list(CategoryNutrition.objects.order_by('id'))
+    recipe_ids = np.fromiter(recipes.order_by('id').values_list('id', flat=True).iterator(), dtype=np.int64)
+    totals = np.zeros((len(recipe_ids), len(NUTRIENTS)))
+    estimated = np.zeros(len(recipe_ids), dtype=bool)
+    links = list(RecipeIngredient.objects.filter(recipe_id__in=recipes)
+                 .values_list('recipe_id', 'ingredient_id__ingredient_name', 'quantity', 'unit').order_by().iterator())
+    if not table or not links:
+        return recipe_ids, totals, estimated
+
+    nutrients = np.array([[getattr(row, name) or 0.0 for name in NUTRIENTS] for row in table])
+    item_g = np.array([row.item_g or 0.0 for row in table])
+    categories = {row.category: index for index, row in enumerate(table)}
+    link_recipes, names, quantities, units = (np.array(column) for column in zip(*links))
+
+    # Parse every distinct name, quantity and unit once and broadcast the results back.
+    names, inverse = np.unique(names, return_inverse=True)
+    columns = np.array([match_category(name, categories) for name in names], dtype=np.int64)[inverse]
+    quantities, inverse = np.unique(quantities, return_inverse=True)
+    amounts = np.array([parse_quantity(quantity) for quantity in quantities])[inverse]
+    units, inverse = np.unique(units, return_inverse=True)
+    per_unit = np.array([unit_grams(unit) for unit in units])[inverse]
+
+    rows = np.searchsorted(recipe_ids, link_recipes.astype(np.int64))
+    matched = columns >= 0
+    # Links of recipes created after the id snapshot are picked up by the next run.
+    matched &= rows < len(recipe_ids)
+    matched[matched] = recipe_ids[rows[matched]] == link_recipes[matched]
+    rows, columns = rows[matched], columns[matched]
+    grams = np.where(np.isnan(amounts[matched]), 1.0, amounts[matched]) * \
+        np.where(np.isnan(per_unit[matched]), item_g[columns], per_unit[matched])
+    np.add.at(totals, rows, grams[:, None] * nutrients[columns] / 100.0)
+    estimated[rows] = True
+    return recipe_ids, totals, estimated
+
+
+def nutrition_values(recipe_ids, totals, estimated):
+    """Yields (recipe_id, {field: value}) with None for recipes that could not be estimated."""
+    for recipe_id, values, known in zip(recipe_ids, totals, estimated):
+        yield int(recipe_id), {name: round(float(value), 2) if known else None
+                               for name, value in zip(NUTRIENTS, values)}
+
+
+def estimate_recipe_nutrition(recipes=None, batch_size=1000):
+    """Estimates and stores the nutrients of ``recipes`` (the whole catalog by default)."""
+    recipes = Recipe.objects.all() if recipes is None else recipes
+    recipe_ids, totals, estimated = estimate(recipes)
+    updates = [Recipe(id=recipe_id, **values) for recipe_id, values in nutrition_values(recipe_ids, totals, estimated)]
+    with transaction.atomic():
+        Recipe.objects.bulk_update(updates, NUTRIENTS, batch_size=batch_size)
+    return int(estimated.sum()), len(updates)
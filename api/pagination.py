@@ -0,0 +1,134 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import BooleanField, Expression, F, Q, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowComparison(Expression):
+    """
+    ``(a, b) < (x, y)`` as a single SQL row comparison, which Postgres answers with a
+    range scan of a composite index on (a, b), where the equivalent OR of column
+    comparisons only filters the rows it reads.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, lhs, operator, rhs):
+        super().__init__()
+        self.lhs, self.operator, self.rhs = list(lhs), operator, list(rhs)
+
+    def get_source_expressions(self):
+        return self.lhs + self.rhs
+
+    def set_source_expressions(self, expressions):
+        self.lhs, self.rhs = expressions[:len(self.lhs)], expressions[len(self.lhs):]
+
+    def as_sql(self, compiler, connection):
+        sides, params = [], []
+        for side in (self.lhs, self.rhs):
+            parts = []
+            for expression in side:
+                sql, expression_params = compiler.compile(expression)
+                parts.append(sql)
+                params.extend(expression_params)
+            sides.append('({})'.format(', '.join(parts)))
+        return '({} {} {})'.format(sides[0], self.operator, sides[1]), params
+
+
+class KeysetResultsSetPagination(BasePagination):
+    """
+    Cursor pagination over the ordering already applied to the queryset.
+
+    The cursor holds the (ordering value, id) pair of the last row on the page, so
+    every page is fetched with an indexed range condition instead of an OFFSET and
+    no total count is computed. A second ordering term, if the queryset has one,
+    breaks ties; it must hold the primary key, possibly through a one-to-one
+    relation, so that it can sit next to the ordering column in one index. The
+    ordering column must not be NULL.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        order_by = queryset.query.order_by
+        ordering = order_by[0] if order_by else 'id'
+        self.descending = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+        self.tie_breaker = order_by[1].lstrip('-') if len(order_by) > 1 else 'id'
+        tie_breaker = '-' + self.tie_breaker if self.descending else self.tie_breaker
+        queryset = queryset.order_by(ordering, tie_breaker) if self.field != 'id' else queryset.order_by(ordering)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(*cursor))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def after(self, value, pk):
+        """Condition selecting the rows after the (value, pk) position."""
+        if self.field == 'id':
+            return Q(**{'id__lt' if self.descending else 'id__gt': pk})
+        return RowComparison([F(self.field), F(self.tie_breaker)], '<' if self.descending else '>',
+                             [Value(value), Value(pk)])
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            value, pk = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def encode_cursor(self, obj):
+        position = json.dumps([getattr(obj, self.field), obj.pk])
+        return urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+
+class KeysetPaginationMixin:
+    """
+    Switches a list view to KeysetResultsSetPagination when called with
+    ``?pagination=cursor``, keeping the default pagination otherwise.
+    """
+    keyset_pagination_class = KeysetResultsSetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.request.query_params.get('pagination') == 'cursor':
+            self.pagination_class = self.keyset_pagination_class
+        return super().paginator
@@ -0,0 +1,103 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from scipy import sparse
+
+from .cache import get_version, CATALOG_VERSION_KEY
+from .models import Recipe, RecipeIngredient, Ingredient, Product
+
+DEFAULT_WEIGHTS = {'coverage': 1.0, 'urgency': 0.5, 'missing': 0.05}
+URGENCY_HORIZON_DAYS = 7
+
+
+class RecipeMatrix:
+    """
+    Sparse recipe x ingredient incidence matrix of the whole catalog, used to
+    score every recipe against a fridge with a few vectorized operations.
+    """
+
+    def __init__(self, recipe_ids, ingredient_ids, matrix):
+        self.recipe_ids = recipe_ids
+        self.ingredient_ids = ingredient_ids
+        self.matrix = matrix
+        self.sizes = np.asarray(matrix.sum(axis=1)).ravel()
+
+    @classmethod
+    def build(cls):
+        recipe_ids = np.fromiter(Recipe.objects.order_by('id').values_list('id', flat=True).iterator(),
+                                 dtype=np.int64)
+        links = np.array(list(RecipeIngredient.objects.values_list('recipe_id', 'ingredient_id').order_by()
+                              .iterator()), dtype=np.int64).reshape(-1, 2)
+        # Links of recipes created after the id snapshot are picked up by the next refresh.
+        rows = np.searchsorted(recipe_ids, links[:, 0])
+        known = rows < len(recipe_ids)
+        known[known] = recipe_ids[rows[known]] == links[known, 0]
+        ingredient_ids, columns = np.unique(links[known, 1], return_inverse=True)
+        matrix = sparse.csr_matrix((np.ones(len(columns)), (rows[known], columns)),
+                                   shape=(len(recipe_ids), len(ingredient_ids)))
+        matrix.sum_duplicates()
+        matrix.data.fill(1.0)
+        return cls(recipe_ids, ingredient_ids, matrix)
+
+    def fridge_vectors(self, products):
+        """
+        Turns (ingredient_id, days until expiry) pairs into a presence vector and an
+        urgency vector over the matrix columns. Urgency grows linearly from 0 at
+        URGENCY_HORIZON_DAYS to 1 for products expiring today or already expired.
+        """
+        present = np.zeros(len(self.ingredient_ids))
+        urgency = np.zeros(len(self.ingredient_ids))
+        if not products:
+            return present, urgency
+        ingredient_ids = np.array([ingredient_id for ingredient_id, days in products], dtype=np.int64)
+        days_left = np.array([days for ingredient_id, days in products], dtype=float)
+        columns = np.searchsorted(self.ingredient_ids, ingredient_ids)
+        known = columns < len(self.ingredient_ids)
+        known[known] = self.ingredient_ids[columns[known]] == ingredient_ids[known]
+        present[columns[known]] = 1.0
+        np.maximum.at(urgency, columns[known],
+                      np.clip((URGENCY_HORIZON_DAYS - days_left[known]) / URGENCY_HORIZON_DAYS, 0.0, 1.0))
+        return present, urgency
+
+    def score(self, products, weights=None):
+        weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        present, urgency = self.fridge_vectors(products)
+        hits = self.matrix @ present
+        coverage = np.divide(hits, self.sizes, out=np.zeros_like(hits), where=self.sizes > 0)
+        missing = self.sizes - hits
+        urgency_share = (self.matrix @ urgency) / max(urgency.sum(), 1.0)
+        scores = (weights['coverage'] * coverage + weights['urgency'] * urgency_share
+                  - weights['missing'] * missing)
+        candidates = np.flatnonzero(hits > 0)
+        # Highest score first, ties broken by recipe id.
+        order = candidates[np.lexsort((self.recipe_ids[candidates], -scores[candidates]))]
+        return [(int(self.recipe_ids[i]), float(scores[i]), float(coverage[i]), int(missing[i])) for i in order]
+
+
+_lock = threading.Lock()
+_matrix = None
+_matrix_version = None
+
+
+def get_recipe_matrix():
+    global _matrix, _matrix_version
+    version = get_version(CATALOG_VERSION_KEY)
+    with _lock:
+        if _matrix is None or _matrix_version != version:
+            _matrix = RecipeMatrix.build()
+            _matrix_version = version
+        return _matrix
+
+
+def score_fridge(fridge_id):
+    """Returns (recipe_id, score, coverage, missing) for every recipe sharing an ingredient with the fridge."""
+    today = timezone.localdate()
+    products = list(Product.objects.filter(fridge_id=fridge_id).values_list('category', 'expiration_date'))
+    ingredient_ids = dict(Ingredient.objects.filter(ingredient_name__in={category for category, expiration_date in
+                                                                         products})
+                          .values_list('ingredient_name', 'id'))
+    vector = [(ingredient_ids[category], (timezone.localtime(expiration_date).date() - today).days)
+              for category, expiration_date in products if category in ingredient_ids]
+    return get_recipe_matrix().score(vector, getattr(settings, 'RECOMMENDATION_SCORE_WEIGHTS', None))
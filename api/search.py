@@ -0,0 +1,38 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import CharField, lookups
+
+
+@CharField.register_lookup
+class TrigramIContains(lookups.IContains):
+    """
+    Case-insensitive substring match written as a bare ``ILIKE`` so that Postgres
+    can answer it from a ``gin_trgm_ops`` index (``icontains`` wraps the column in
+    ``UPPER()``, which no index covers).
+    """
+    lookup_name = 'trgm_icontains'
+
+    def as_postgresql(self, compiler, connection):
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return '%s ILIKE %s' % (lhs_sql, rhs_sql), lhs_params + rhs_params
+
+
+def enable_trigram_extension(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def search_recipes(queryset, term):
+    return queryset.filter(recipe_name__trgm_icontains=term).annotate(
+        similarity=TrigramSimilarity('recipe_name', term))
+
+
+def search_ingredients(queryset, term, prefix=False):
+    term = term.lower()
+    if prefix:
+        return queryset.filter(ingredient_name__startswith=term).order_by('ingredient_name')
+    return queryset.filter(ingredient_name__trgm_icontains=term).annotate(
+        similarity=TrigramSimilarity('ingredient_name', term)).order_by('-similarity', 'ingredient_name')
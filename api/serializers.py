@@ -2,10 +2,11 @@ from django.contrib.auth import password_validation
 from django.contrib.auth.models import User, UserManager
 from rest_framework import serializers
 
-from .models import Product, Fridge, Recipe, Comment, Rating, Ingredient
+from .metrics import TimedSerializerMixin
+from .models import NUTRIENTS, Product, Fridge, Recipe, Comment, Rating, Ingredient
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     fridges = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
     class Meta:
@@ -13,7 +14,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'fridges']
 
 
-class UserCreateSerializer(serializers.ModelSerializer):
+class UserCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('username', 'email', 'password')
@@ -54,7 +55,7 @@ class ChangePasswordSerializer(serializers.Serializer):
         return user
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     fridge_id = serializers.PrimaryKeyRelatedField(queryset=Fridge.objects.get_queryset())
 
     class Meta:
@@ -65,7 +66,13 @@ class ProductSerializer(serializers.ModelSerializer):
             'proteins', 'sugar', 'salt', 'sodium', 'image_url', 'date_added', 'expiration_date', 'fridge_id')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class BulkProductSerializer(ProductSerializer):
+    # Fridges are resolved for the whole batch at once instead of per item.
+    id = serializers.IntegerField(required=False)
+    fridge_id = serializers.IntegerField()
+
+
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     comments = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     rating = serializers.FloatField(required=False)
     ratings_num = serializers.IntegerField(required=False)
@@ -76,10 +83,21 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'user_id', 'recipe_name', 'difficulty', 'tags', 'ingredients', 'description', 'instructions',
             'image_url',
-            'meal', 'prep_time', 'rating', 'ratings_num', 'comments', 'popularity')
+            'meal', 'prep_time', 'rating', 'ratings_num', 'comments', 'popularity', 'energy_kcal', 'fat',
+            'carbohydrates', 'proteins', 'fiber', 'sugar', 'salt', 'sodium')
+        read_only_fields = NUTRIENTS
+
+
+class ScoredRecipeSerializer(RecipeSerializer):
+    score = serializers.FloatField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('score', 'coverage', 'missing_ingredients')
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     recipe_id = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.get_queryset())
 
     class Meta:
@@ -87,7 +105,7 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ('id', 'author', 'author_name', 'date_added', 'content', 'recipe_id')
 
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     recipe_id = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.get_queryset())
 
     class Meta:
@@ -101,7 +119,7 @@ class RatingSerializer(serializers.ModelSerializer):
         return rating
 
 
-class FridgeSerializer(serializers.ModelSerializer):
+class FridgeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     products = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
     class Meta:
@@ -109,7 +127,7 @@ class FridgeSerializer(serializers.ModelSerializer):
         fields = ('id', 'fridge_name', 'user_id', 'products')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
@@ -1,14 +1,24 @@
-from django.core.mail import EmailMultiAlternatives
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_init, pre_delete, post_delete
 from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import timezone
 
 from django_rest_resetpassword.signals import reset_password_token_created
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+from .cache import bump_catalog_version, bump_recipe_versions, bump_version, \
+    user_fridges_version_key
+from .lifecycle import fridges_changed
+from .mail import enqueue_email
+from .models import DailyRollup, CategoryRollup, Fridge, Product, Recipe, RecipeIngredient, Rating, Comment, RecipeStats
+from .nutrition import estimate, nutrition_values
 
 
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token, *args, **kwargs):
-    print("-----------------SENT EMAIL-----------------")
     context = {
         'current_user': reset_password_token.user,
         'username': reset_password_token.user.username,
@@ -19,11 +29,189 @@ def password_reset_token_created(sender, instance, reset_password_token, *args,
     email_html = render_to_string('../templates/email/reset_password.html', context)
     email_plaintext = render_to_string('../templates/email/reset_password.txt', context)
 
-    msg = EmailMultiAlternatives(
+    enqueue_email(
         "Password Reset for {title}".format(title="Wasteless"),
         email_plaintext,
-        "wasteless.mail@gmail.com",
-        [reset_password_token.user.email]
+        [reset_password_token.user.email],
+        html_body=email_html
     )
-    msg.attach_alternative(email_html, "text/html")
-    msg.send()
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_count_ingredients(sender, instance, *args, **kwargs):
+    instance.ingredients_num = len(instance.ingredients)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_update_ingredients(sender, instance, *args, **kwargs):
+    RecipeIngredient.rebuild([instance])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_invalidate_recommendations(sender, instance, *args, **kwargs):
+    bump_catalog_version()
+    bump_recipe_versions(instance.id)
+
+
+@receiver(post_init, sender=Product)
+def product_remember_fridge(sender, instance, *args, **kwargs):
+    instance._saved_fridge_id = instance.fridge_id_id if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_invalidate_recommendations(sender, instance, raw=False, *args, **kwargs):
+    if not raw:
+        fridges_changed(instance.fridge_id_id, instance._saved_fridge_id)
+    instance._saved_fridge_id = instance.fridge_id_id
+
+
+@receiver(post_save, sender=Fridge)
+@receiver(post_delete, sender=Fridge)
+def fridge_invalidate_user_fridges(sender, instance, *args, **kwargs):
+    bump_version(user_fridges_version_key(instance.user_id_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_create_stats(sender, instance, created, *args, **kwargs):
+    if created:
+        RecipeStats.objects.create(recipe_id=instance)
+
+
+@receiver(post_init, sender=Rating)
+def rating_remember_state(sender, instance, *args, **kwargs):
+    instance._stats_state = (instance.recipe_id_id, instance.rating) if instance.pk else None
+
+
+@receiver(post_save, sender=Rating)
+def rating_update_stats(sender, instance, created, *args, **kwargs):
+    previous = None if created else instance._stats_state
+    if previous is not None and previous[0] == instance.recipe_id_id:
+        RecipeStats.apply(instance.recipe_id_id, ratings_sum=instance.rating - previous[1])
+        bump_recipe_versions(instance.recipe_id_id)
+    else:
+        if previous is not None:
+            RecipeStats.apply(previous[0], ratings_num=-1, ratings_sum=-previous[1])
+        RecipeStats.apply(instance.recipe_id_id, ratings_num=1, ratings_sum=instance.rating)
+        bump_recipe_versions(instance.recipe_id_id, *([previous[0]] if previous is not None else []))
+    instance._stats_state = (instance.recipe_id_id, instance.rating)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_delete_stats(sender, instance, *args, **kwargs):
+    recipe_id, rating = instance._stats_state or (instance.recipe_id_id, instance.rating)
+    RecipeStats.apply(recipe_id, ratings_num=-1, ratings_sum=-rating)
+    bump_recipe_versions(recipe_id)
+
+
+@receiver(post_init, sender=Comment)
+def comment_remember_state(sender, instance, *args, **kwargs):
+    instance._stats_state = instance.recipe_id_id if instance.pk else None
+
+
+@receiver(post_save, sender=Comment)
+def comment_update_stats(sender, instance, created, *args, **kwargs):
+    previous = None if created else instance._stats_state
+    if previous != instance.recipe_id_id:
+        if previous is not None:
+            RecipeStats.apply(previous, comments_num=-1)
+        RecipeStats.apply(instance.recipe_id_id, comments_num=1)
+    bump_recipe_versions(*{instance.recipe_id_id, previous} - {None})
+    instance._stats_state = instance.recipe_id_id
+
+
+@receiver(post_delete, sender=Comment)
+def comment_delete_stats(sender, instance, *args, **kwargs):
+    recipe_id = instance._stats_state or instance.recipe_id_id
+    RecipeStats.apply(recipe_id, comments_num=-1)
+    bump_recipe_versions(recipe_id)
+
+
+@receiver(post_delete, sender=Token)
+def token_invalidate_cache(sender, instance, *args, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_invalidate_token_cache(sender, instance, created, *args, **kwargs):
+    if not created:
+        for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+            invalidate_token(key)
+
+
+@receiver(post_init, sender=Product)
+def product_remember_added(sender, instance, *args, **kwargs):
+    # Read through __dict__: touching a deferred date_added would load it, and the loaded
+    # instance, with all its other fields deferred, would come back here.
+    date_added = instance.__dict__.get('date_added')
+    instance._rollup_day = timezone.localdate(date_added) if instance.pk and date_added else None
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def product_load_added(sender, instance, *args, **kwargs):
+    # Products loaded without date_added only look up the stored day when they are written.
+    if instance._rollup_day is None and instance.pk and not instance._state.adding:
+        date_added = Product.objects.filter(pk=instance.pk).values_list('date_added', flat=True).first()
+        instance._rollup_day = date_added and timezone.localdate(date_added)
+
+
+@receiver(post_save, sender=Product)
+def product_update_rollup(sender, instance, created, *args, **kwargs):
+    day = timezone.localdate(instance.date_added)
+    if created:
+        DailyRollup.add('products', day)
+    elif instance._rollup_day is not None and instance._rollup_day != day:
+        DailyRollup.add('products', instance._rollup_day, -1)
+        DailyRollup.add('products', day)
+    instance._rollup_day = day
+
+
+@receiver(post_delete, sender=Product)
+def product_delete_rollup(sender, instance, *args, **kwargs):
+    DailyRollup.add('products', instance._rollup_day or timezone.localdate(instance.date_added), -1)
+
+
+@receiver(post_save, sender=User)
+def user_update_rollup(sender, instance, created, *args, **kwargs):
+    if created:
+        DailyRollup.add('users', timezone.localdate(instance.date_joined))
+
+
+@receiver(post_delete, sender=User)
+def user_delete_rollup(sender, instance, *args, **kwargs):
+    DailyRollup.add('users', timezone.localdate(instance.date_joined), -1)
+
+
+@receiver(post_init, sender=Recipe)
+def recipe_remember_categories(sender, instance, *args, **kwargs):
+    instance._rollup_categories = (instance.difficulty, instance.meal) if instance.pk else None
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_update_rollup(sender, instance, created, *args, **kwargs):
+    previous = None if created else instance._rollup_categories
+    current = (instance.difficulty, instance.meal)
+    for metric, old, new in zip(('difficulty', 'meal'), previous or (None, None), current):
+        if old != new:
+            if old is not None:
+                CategoryRollup.add(metric, old, -1)
+            CategoryRollup.add(metric, new)
+    instance._rollup_categories = current
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_delete_rollup(sender, instance, *args, **kwargs):
+    difficulty, meal = instance._rollup_categories or (instance.difficulty, instance.meal)
+    CategoryRollup.add('difficulty', difficulty, -1)
+    CategoryRollup.add('meal', meal, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_estimate_nutrition(sender, instance, *args, **kwargs):
+    # Connected after recipe_update_ingredients, so the estimate sees the saved ingredient rows.
+    for recipe_id, values in nutrition_values(*estimate(Recipe.objects.filter(pk=instance.pk))):
+        Recipe.objects.filter(pk=recipe_id).update(**values)
+        for field, value in values.items():
+            setattr(instance, field, value)
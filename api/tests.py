@@ -1,3 +1,708 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import tempfile
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from .authentication import get_cache as get_auth_cache, token_cache_key
+from .cache import bump_catalog_version, bump_version, fridge_version_key, recommendation_cache_stats
+from .models import Fridge, Product, Recipe, Comment, Rating, RecipeStats, ExpiryDigestRun, \
+    DailyRollup, RecipeIngredient, OutboundEmail, Ingredient
+from .lifecycle import archive_products, collect_waste
+from .mail import claim_batch, enqueue_email, queue_metrics, send_queued_emails
+from .nutrition import build_category_table
+from .scoring import DEFAULT_WEIGHTS, URGENCY_HORIZON_DAYS, get_recipe_matrix, score_fridge
+
+
+class FridgeFixtures:
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        self.fridge = self.create_fridge()
+
+    def create_fridge(self, user=None):
+        fridge = Fridge.objects.create(fridge_name='Fridge', user_id=user or self.user)
+        for _ in range(3):
+            Product.objects.create(product_name='Milk', category='milk', quantity_g=1000, quantity=1,
+                                   carbohydrates=4.8, energy_kcal=64, fat=3.6, fiber=0, proteins=3.3, salt=0.1,
+                                   sodium=0.04, date_added=timezone.now(), expiration_date=timezone.now(),
+                                   fridge_id=fridge)
+        return fridge
+
+    def create_user(self):
+        user = User.objects.create_user('user{}'.format(User.objects.count()), 'user@example.com', 'password')
+        self.create_fridge(user)
+        return user
+
+    def create_recipe(self):
+        recipe = Recipe.objects.create(recipe_name='Pancakes', ingredients=[['milk', '1', 'l'], ['flour', '300', 'g']],
+                                       description='', instructions='', image_url='')
+        for _ in range(3):
+            Comment.objects.create(author=self.user, author_name='admin', date_added=timezone.now(),
+                                   content='Tasty', recipe_id=recipe)
+        return recipe
+
+
+class FridgeTestCase(FridgeFixtures, APITestCase):
+    pass
+
+
+class ListQueryCountTests(FridgeTestCase):
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, create_row):
+        create_row()
+        queries = self.count_queries(url)
+        for _ in range(5):
+            create_row()
+        self.assertEqual(self.count_queries(url), queries)
+
+    def test_recipe_list(self):
+        self.assertConstantQueries('/recipes/', self.create_recipe)
+
+    def test_recipe_list_with_cursor(self):
+        self.assertConstantQueries('/recipes/?pagination=cursor', self.create_recipe)
+
+    def test_recommendations(self):
+        self.assertConstantQueries('/profile/recommend/{}'.format(self.fridge.id), self.create_recipe)
+
+    def test_urgent_recommendations(self):
+        url = '/profile/urgent/{}'.format(self.fridge.id)
+        self.assertConstantQueries(url, self.create_recipe)
+        # Three expiring milk products count as one ingredient, which every pancake recipe has.
+        self.assertEqual(self.client.get(url).data['count'], Recipe.objects.count())
+
+    def test_fridge_list(self):
+        self.assertConstantQueries('/fridges/', self.create_fridge)
+
+    def test_current_user_fridges(self):
+        self.assertConstantQueries('/profile/fridges/', self.create_fridge)
+
+    def test_fridge_list_with_products(self):
+        # Products are prefetched with only their ids, which must not load the rest of each row.
+        response = self.client.get('/profile/fridges/')
+        self.assertEqual(response.status_code, 200)
+        product_ids = sorted(self.fridge.products.values_list('id', flat=True))
+        self.assertEqual(sorted(response.data[0]['products']), product_ids)
+
+    def test_deferred_product_rollup(self):
+        product = Product.objects.only('id', 'fridge_id').get(pk=self.fridge.products.first().pk)
+        product.date_added = timezone.now() - datetime.timedelta(days=10)
+        product.save()
+        product = Product.objects.only('id', 'fridge_id').get(pk=product.pk)
+        product.delete()
+        self.assertEqual(DailyRollup.objects.get(metric='products', day=timezone.localdate()).count, 2)
+        ten_days_ago = timezone.localdate() - datetime.timedelta(days=10)
+        self.assertEqual(DailyRollup.objects.get(metric='products', day=ten_days_ago).count, 0)
+
+    def test_user_list(self):
+        self.assertConstantQueries('/users/', self.create_user)
+
+
+class FridgeNutritionTests(FridgeFixtures, APITransactionTestCase):
+    # The summary row is refreshed in transaction.on_commit hooks, which TestCase never runs.
+    def test_totals_are_scaled_by_quantity(self):
+        response = self.client.get('/profile/nutrition/{}?live=1'.format(self.fridge.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['products'], 3)
+        self.assertEqual(response.data['totals']['energy_kcal'], 3 * 640)
+        self.assertEqual(response.data['categories'][0]['category'], 'milk')
+
+    def test_summary_row_follows_product_writes(self):
+        url = '/profile/nutrition/{}'.format(self.fridge.id)
+        self.assertEqual(self.client.get(url).data['totals']['products'], 3)
+        self.fridge.products.first().delete()
+        self.assertEqual(self.client.get(url).data['totals'], self.client.get(url + '?live=1').data['totals'])
+        self.assertEqual(self.client.get(url).data['totals']['products'], 2)
+
+
+class RecipeNutritionTests(FridgeTestCase):
+    def test_recipe_nutrition_is_estimated_from_categories(self):
+        build_category_table()
+        recipe = self.create_recipe()
+        recipe.refresh_from_db()
+        # 1 l of milk at 64 kcal per 100 g; flour has no product category.
+        self.assertEqual(recipe.energy_kcal, 640)
+
+    def test_kcal_filter(self):
+        build_category_table()
+        self.create_recipe()
+        self.assertEqual(self.client.get('/recipes/?kcal_max=600').data['count'], 0)
+        self.assertEqual(self.client.get('/recipes/?kcal_min=600&order=ka').data['count'], 1)
+
+
+class WasteTests(FridgeTestCase):
+    def test_expired_products_become_waste_events(self):
+        self.assertEqual(collect_waste(grace_days=0), 3)
+        self.assertFalse(Product.objects.exists())
+        response = self.client.get('/profile/waste/')
+        self.assertEqual(response.data['weeks'][-1]['products'], 3)
+        self.assertEqual(response.data['categories'][0]['total_g'], 3000)
+
+
+class ArchiveTests(FridgeTestCase):
+    def test_archived_products_are_opt_in(self):
+        Product.objects.update(date_added=timezone.now() - datetime.timedelta(days=400),
+                               expiration_date=timezone.now() + datetime.timedelta(days=30))
+        self.assertEqual(archive_products(365), 3)
+        url = '/fridge/{}/'.format(self.fridge.id)
+        self.assertEqual(len(self.client.get(url).data), 0)
+        self.assertEqual(len(self.client.get(url + '?include_archived=1').data), 3)
+
+
+class ImportRecipesTests(FridgeTestCase):
+    def import_file(self, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8') as source:
+            source.write('\n'.join(json.dumps(row) for row in rows))
+            source.flush()
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('import_recipes', source.name, batch_size=2, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_invalid_rows_are_skipped_and_reruns_do_not_duplicate(self):
+        rows = [{'recipe_name': 'Recipe {}'.format(index), 'ingredients': [['milk', '1', 'l']]} for index in range(3)]
+        rows.append({'recipe_name': 'Bad difficulty', 'difficulty': 'XX'})
+        rows.append({'recipe_name': 'Bad ingredients', 'ingredients': ['milk']})
+        self.assertIn('Imported 3 recipes (2 skipped)', self.import_file(rows)[0])
+        stdout, stderr = self.import_file(rows)
+        self.assertIn('Imported 0 recipes (5 skipped)', stdout)
+        self.assertIn('Skipping recipe "Recipe 0": it already exists', stderr)
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.assertFalse(Recipe.objects.filter(stats__isnull=True).exists())
+
+    def test_repeated_names_are_reported(self):
+        rows = [{'recipe_name': name, 'ingredients': [['milk', '1', 'l']]} for name in ('Soup', 'Soup', 'Salad')]
+        stdout, stderr = self.import_file(rows)
+        self.assertIn('Imported 2 recipes (1 skipped)', stdout)
+        self.assertIn('Skipping recipe "Soup": the name repeats an earlier row', stderr)
+
+
+class KeysetPaginationTests(FridgeTestCase):
+    def setUp(self):
+        super().setUp()
+        recipes = [Recipe.objects.create(recipe_name='Recipe {}'.format(index % 3), ingredients=[],
+                                         description='', instructions='', image_url='') for index in range(9)]
+        # Ties on popularity and rating; the last three keep the zero stats of a new recipe.
+        for index, recipe in enumerate(recipes[:6]):
+            RecipeStats.objects.filter(recipe_id=recipe).update(popularity=index % 2, rating=index % 3)
+
+    def walk(self, order):
+        ids = []
+        url = '/recipes/?pagination=cursor&page_size=2&order={}'.format(order)
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_pages_are_disjoint_and_complete(self):
+        expected = sorted(Recipe.objects.values_list('id', flat=True))
+        for order in ('pp', 'rd', 'ra', 'na', 'nd'):
+            ids = self.walk(order)
+            self.assertEqual(len(ids), len(set(ids)), order)
+            self.assertEqual(sorted(ids), expected, order)
+
+    def listing_plan(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        listing = [query['sql'] for query in context.captured_queries if 'LIMIT' in query['sql']]
+        with connection.cursor() as cursor:
+            # With sorting priced out, a plan without a Sort node means an index provides the order.
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + listing[-1])
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_stats_orderings_read_an_index(self):
+        for order in ('pp', 'rd', 'ra', 'pa'):
+            url = '/recipes/?pagination=cursor&page_size=2&order={}'.format(order)
+            next_url = self.client.get(url).data['next']
+            for page in (url, next_url):
+                plan = self.listing_plan(page)
+                self.assertNotIn('Sort', plan, plan)
+                self.assertIn('api_recipestats', plan)
+
+
+class BulkProductTests(FridgeTestCase):
+    url = '/products/bulk/'
+
+    def product_data(self, **data):
+        now = timezone.now().isoformat()
+        return dict({'product_name': 'Eggs', 'category': 'eggs', 'quantity_g': 60, 'quantity': 6,
+                     'carbohydrates': 1.1, 'energy_kcal': 143, 'fat': 9.5, 'fiber': 0, 'proteins': 12.6,
+                     'salt': 0.4, 'sodium': 0.14, 'date_added': now, 'expiration_date': now,
+                     'fridge_id': self.fridge.id}, **data)
+
+    def post(self, items):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, items, format='json')
+        return response, len(context.captured_queries)
+
+    def test_create_and_update_in_one_request(self):
+        product = self.fridge.products.first()
+        response, queries = self.post([self.product_data(), self.product_data(id=product.id, quantity=2)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual(len(response.data['updated']), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 2)
+        self.assertEqual(self.fridge.products.count(), 4)
+
+    def test_updates_only_return_ok(self):
+        product = self.fridge.products.first()
+        response, queries = self.post([self.product_data(id=product.id, quantity=2)])
+        self.assertEqual(response.status_code, 200)
+
+    def test_per_item_errors(self):
+        product = self.fridge.products.first()
+        other_fridge = self.create_user().fridges.get()
+        response, queries = self.post([
+            self.product_data(),
+            self.product_data(quantity='many'),
+            self.product_data(fridge_id=other_fridge.id),
+            self.product_data(id=product.id),
+            self.product_data(id=product.id),
+            self.product_data(id=0),
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 4, 5])
+        self.assertEqual(self.fridge.products.count(), 3)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        products = list(self.fridge.products.all())
+        response, small = self.post([self.product_data(), self.product_data(id=products[0].id)])
+        self.assertEqual(response.status_code, 201)
+        response, large = self.post([self.product_data() for _ in range(10)] +
+                                    [self.product_data(id=product.id) for product in products])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(large, small)
+
+
+class RecipeStatsTests(FridgeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe()
+        self.other_recipe = self.create_recipe()
+
+    def assertStatsMatchRebuild(self):
+        fields = ('recipe_id', 'ratings_num', 'ratings_sum', 'comments_num', 'rating', 'popularity')
+        incremental = list(RecipeStats.objects.order_by('recipe_id').values_list(*fields))
+        call_command('rebuild_recipe_stats', stdout=io.StringIO())
+        rebuilt = list(RecipeStats.objects.order_by('recipe_id').values_list(*fields))
+        self.assertEqual(len(incremental), len(rebuilt))
+        for current, expected in zip(incremental, rebuilt):
+            self.assertEqual(current[:4], expected[:4])
+            self.assertAlmostEqual(current[4], expected[4])
+            self.assertAlmostEqual(current[5], expected[5])
+
+    def rate(self, recipe, rating):
+        response = self.client.post('/profile/ratings/{}/'.format(recipe.id),
+                                    {'rating': rating, 'recipe_id': recipe.id}, format='json')
+        self.assertIn(response.status_code, (200, 201))
+
+    def test_rating_create(self):
+        self.rate(self.recipe, 4)
+        self.assertEqual(RecipeStats.objects.get(recipe_id=self.recipe).ratings_num, 1)
+        self.assertStatsMatchRebuild()
+
+    def test_rating_update_or_create(self):
+        self.rate(self.recipe, 4)
+        self.rate(self.recipe, 2)
+        stats = RecipeStats.objects.get(recipe_id=self.recipe)
+        self.assertEqual((stats.ratings_num, stats.rating), (1, 2.0))
+        self.assertStatsMatchRebuild()
+
+    def test_rating_update(self):
+        self.rate(self.recipe, 4)
+        response = self.client.put('/profile/ratings/{}/'.format(self.recipe.id),
+                                   {'rating': 5, 'recipe_id': self.recipe.id, 'user_id': self.user.id},
+                                   format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RecipeStats.objects.get(recipe_id=self.recipe).rating, 5.0)
+        self.assertStatsMatchRebuild()
+
+    def test_rating_move(self):
+        self.rate(self.recipe, 4)
+        rating = Rating.objects.get()
+        rating.recipe_id = self.other_recipe
+        rating.save()
+        self.assertEqual(RecipeStats.objects.get(recipe_id=self.recipe).ratings_num, 0)
+        self.assertEqual(RecipeStats.objects.get(recipe_id=self.other_recipe).ratings_num, 1)
+        self.assertStatsMatchRebuild()
+
+    def test_rating_delete(self):
+        self.rate(self.recipe, 4)
+        self.rate(self.other_recipe, 3)
+        response = self.client.delete('/profile/ratings/{}/'.format(self.recipe.id))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(RecipeStats.objects.get(recipe_id=self.recipe).ratings_num, 0)
+        self.assertStatsMatchRebuild()
+
+    def test_comment_create_and_delete(self):
+        comment = Comment.objects.create(author=self.user, author_name='admin', date_added=timezone.now(),
+                                         content='Again', recipe_id=self.recipe)
+        self.assertEqual(RecipeStats.objects.get(recipe_id=self.recipe).comments_num, 4)
+        self.assertStatsMatchRebuild()
+        comment.delete()
+        self.assertEqual(RecipeStats.objects.get(recipe_id=self.recipe).comments_num, 3)
+        self.assertStatsMatchRebuild()
+
+
+class ConditionalGetTests(FridgeTestCase):
+    def get(self, etag=None):
+        url = '/fridge/{}/'.format(self.fridge.id)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_unchanged_resource(self):
+        etag = self.get()['ETag']
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_write_changes_etag(self):
+        etag = self.get()['ETag']
+        product = self.fridge.products.first()
+        product.quantity = 2
+        product.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_versions_are_shared_between_processes(self):
+        etag = self.get()['ETag']
+        # Another process has its own local cache but bumps the same counter rows.
+        caches['default'].clear()
+        self.assertEqual(self.get(etag).status_code, 304)
+        bump_version(fridge_version_key(self.fridge.id))
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_rolled_back_write_keeps_etag(self):
+        etag = self.get()['ETag']
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.fridge.products.first().delete()
+                raise ValueError
+        self.assertEqual(self.get(etag).status_code, 304)
+
+
+class RecommendationCacheTests(FridgeTestCase):
+    def recommend(self):
+        before = recommendation_cache_stats()
+        response = self.client.get('/profile/recommend/{}'.format(self.fridge.id))
+        after = recommendation_cache_stats()
+        return response.data['count'], after['hits'] - before['hits'], after['misses'] - before['misses']
+
+    def test_product_write_invalidates_recommendations(self):
+        self.create_recipe()
+        self.assertEqual(self.recommend(), (1, 0, 1))
+        self.assertEqual(self.recommend(), (1, 1, 0))
+        for product in self.fridge.products.all():
+            product.delete()
+        self.assertEqual(self.recommend(), (0, 0, 1))
+
+    def test_recipe_write_invalidates_recommendations(self):
+        self.assertEqual(self.recommend(), (0, 0, 1))
+        self.create_recipe()
+        self.assertEqual(self.recommend(), (1, 0, 1))
+
+
+class ScoringTests(FridgeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_recipe()
+        for name, ingredients in (('Omelette', ['eggs', 'milk', 'salt']), ('Salad', ['lettuce', 'tomato'])):
+            Recipe.objects.create(recipe_name=name, ingredients=[[ingredient, '1', ''] for ingredient in ingredients],
+                                  description='', instructions='', image_url='')
+        for category, days in (('eggs', 3), ('caviar', 1)):
+            Product.objects.create(product_name=category.title(), category=category, quantity_g=100, quantity=1,
+                                   carbohydrates=0, energy_kcal=100, fat=0, fiber=0, proteins=0, salt=0, sodium=0,
+                                   date_added=timezone.now(),
+                                   expiration_date=timezone.now() + datetime.timedelta(days=days),
+                                   fridge_id=self.fridge)
+
+    def reference_scores(self):
+        # The per-recipe loop the matrix replaces.
+        today = timezone.localdate()
+        catalog = set(RecipeIngredient.objects.values_list('ingredient_id__ingredient_name', flat=True))
+        urgency = {}
+        for product in self.fridge.products.filter(category__in=catalog):
+            days = (timezone.localtime(product.expiration_date).date() - today).days
+            value = min(max((URGENCY_HORIZON_DAYS - days) / URGENCY_HORIZON_DAYS, 0.0), 1.0)
+            urgency[product.category] = max(urgency.get(product.category, 0.0), value)
+        total_urgency = max(sum(urgency.values()), 1.0)
+        scores = []
+        for recipe in Recipe.objects.all():
+            names = set(recipe.recipe_ingredients.values_list('ingredient_id__ingredient_name', flat=True))
+            hits = names & set(urgency)
+            if not hits:
+                continue
+            coverage = len(hits) / len(names)
+            missing = len(names) - len(hits)
+            score = (DEFAULT_WEIGHTS['coverage'] * coverage
+                     + DEFAULT_WEIGHTS['urgency'] * sum(urgency[name] for name in hits) / total_urgency
+                     - DEFAULT_WEIGHTS['missing'] * missing)
+            scores.append((recipe.id, score, coverage, missing))
+        return sorted(scores, key=lambda row: (-row[1], row[0]))
+
+    def test_scores_match_per_recipe_computation(self):
+        expected = self.reference_scores()
+        ranking = score_fridge(self.fridge.id)
+        self.assertEqual([row[0] for row in ranking], [row[0] for row in expected])
+        self.assertEqual(len(ranking), 2)
+        for row, expected_row in zip(ranking, expected):
+            self.assertAlmostEqual(row[1], expected_row[1])
+            self.assertAlmostEqual(row[2], expected_row[2])
+            self.assertEqual(row[3], expected_row[3])
+
+    def test_matrix_is_rebuilt_after_catalog_change(self):
+        matrix = get_recipe_matrix()
+        self.assertIs(get_recipe_matrix(), matrix)
+        recipe = self.create_recipe()
+        rebuilt = get_recipe_matrix()
+        self.assertIsNot(rebuilt, matrix)
+        self.assertIn(recipe.id, rebuilt.recipe_ids)
+        # A bump made by another process reaches this one through the shared counter.
+        bump_catalog_version()
+        self.assertIsNot(get_recipe_matrix(), rebuilt)
+
+
+class SearchTests(FridgeTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('Pancakes', 'Cheesecake', 'Omelette'):
+            Recipe.objects.create(recipe_name=name, ingredients=[['milk', '1', 'l']], description='', instructions='',
+                                  image_url='')
+        Ingredient.resolve(['almond milk', 'buttermilk', 'milkshake', 'flour'])
+
+    def test_trgm_icontains_is_a_bare_ilike(self):
+        queryset = Recipe.objects.filter(recipe_name__trgm_icontains='CAKE')
+        self.assertIn('ILIKE', str(queryset.query))
+        self.assertNotIn('UPPER', str(queryset.query))
+        self.assertEqual(sorted(queryset.values_list('recipe_name', flat=True)), ['Cheesecake', 'Pancakes'])
+
+    def test_trgm_icontains_reads_the_trigram_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Ingredient.objects.filter(ingredient_name__trgm_icontains='milk').explain()
+        self.assertIn('ingredient_name_trgm', plan)
+
+    def test_recipe_name_search(self):
+        response = self.client.get('/recipes/?name=cake')
+        self.assertEqual(sorted(recipe['recipe_name'] for recipe in response.data['results']),
+                         ['Cheesecake', 'Pancakes'])
+
+    def test_ingredient_prefix_search(self):
+        response = self.client.get('/ingredients/?ingredient=Milk&mode=prefix')
+        self.assertEqual([ingredient['ingredient_name'] for ingredient in response.data], ['milk', 'milkshake'])
+
+    def test_ingredient_fuzzy_search(self):
+        response = self.client.get('/ingredients/?ingredient=milk')
+        names = [ingredient['ingredient_name'] for ingredient in response.data]
+        self.assertEqual(sorted(names), ['almond milk', 'buttermilk', 'milk', 'milkshake'])
+        # The exact match is the most similar.
+        self.assertEqual(names[0], 'milk')
+
+
+class ExpiryDigestTests(FridgeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [self.user, self.create_user(), self.create_user()]
+        no_email = User.objects.create_user('noemail', '', 'password')
+        self.create_fridge(no_email)
+
+    def send_digests(self):
+        call_command('send_expiry_digests', stdout=io.StringIO())
+
+    def test_one_digest_per_user(self):
+        self.send_digests()
+        self.assertEqual(len(mail.outbox), len(self.users))
+        self.assertEqual([message.to for message in mail.outbox], [[user.email] for user in self.users])
+        self.assertTrue(ExpiryDigestRun.objects.get(run_date=timezone.localdate()).finished)
+
+        self.send_digests()
+        self.assertEqual(len(mail.outbox), len(self.users))
+
+    def test_resume_from_checkpoint(self):
+        # A run that stopped after mailing the first user.
+        ExpiryDigestRun.objects.create(run_date=timezone.localdate(), last_user_id=self.users[0].id)
+        self.send_digests()
+        self.assertEqual([message.to for message in mail.outbox], [[user.email] for user in self.users[1:]])
+
+        self.send_digests()
+        self.assertEqual(len(mail.outbox), len(self.users) - 1)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP unavailable')
+
+
+@override_settings(MAIL_QUEUE_RETRY_DELAY=30, MAIL_QUEUE_MAX_ATTEMPTS=3)
+class MailQueueTests(APITestCase):
+    def enqueue(self):
+        return enqueue_email('Subject', 'Body', ['user@example.com'])
+
+    def test_sends_due_messages(self):
+        emails = [self.enqueue(), self.enqueue()]
+        self.assertEqual(send_queued_emails(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        for email in emails:
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.SENT, 1))
+        self.assertEqual(send_queued_emails(), 0)
+
+    @override_settings(EMAIL_BACKEND='api.tests.FailingEmailBackend')
+    def test_failures_back_off_then_give_up(self):
+        email = self.enqueue()
+        for attempts, delay in ((1, 30), (2, 60)):
+            started = timezone.now()
+            self.assertEqual(send_queued_emails(), 0)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.QUEUED, attempts))
+            self.assertEqual(email.last_error, 'SMTP unavailable')
+            self.assertGreaterEqual(email.next_attempt_at, started + datetime.timedelta(seconds=delay))
+            self.assertLessEqual(email.next_attempt_at, timezone.now() + datetime.timedelta(seconds=delay))
+
+            # Not due again until the backoff runs out.
+            self.assertEqual(send_queued_emails(), 0)
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, attempts)
+            OutboundEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+
+        send_queued_emails()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 3))
+
+    def test_claimed_messages_are_leased(self):
+        email = self.enqueue()
+        now = timezone.now()
+        self.assertEqual([claimed.id for claimed in claim_batch(10, now)], [email.id])
+        # Another worker sees nothing due while the lease lasts.
+        self.assertEqual(claim_batch(10, now), [])
+        self.assertEqual(send_queued_emails(), 0)
+        self.assertEqual(claim_batch(10, now + datetime.timedelta(seconds=301))[0].id, email.id)
+
+    def test_queue_metrics(self):
+        old = self.enqueue()
+        OutboundEmail.objects.filter(id=old.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        self.enqueue()
+        OutboundEmail.objects.filter(id=self.enqueue().id).update(status=OutboundEmail.SENT)
+        OutboundEmail.objects.filter(id=self.enqueue().id).update(status=OutboundEmail.FAILED)
+        metrics = queue_metrics()
+        self.assertEqual((metrics['queued'], metrics['sent'], metrics['failed']), (2, 1, 1))
+        self.assertGreaterEqual(metrics['oldest_queued_age'], 3600)
+
+
+class TokenCacheTests(APITestCase):
+    password = 'Old-passw0rd-123'
+
+    def setUp(self):
+        self.user = User.objects.create_user('cached', 'cached@example.com', self.password)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(self.token.key))
+        self.assertEqual(self.client.get('/profile/').status_code, 200)
+        self.assertIsNotNone(get_auth_cache().get(token_cache_key(self.token.key)))
+
+    def assertTokenRejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(self.token.key))
+        self.assertEqual(self.client.get('/profile/').status_code, 401)
+
+    def test_logout(self):
+        self.assertEqual(self.client.get('/logout/').status_code, 200)
+        self.assertTokenRejected()
+
+    def test_change_password(self):
+        response = self.client.put('/profile/changepassword', {
+            'old_password': self.password, 'new_password1': 'New-passw0rd-456', 'new_password2': 'New-passw0rd-456'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['token'], self.token.key)
+        self.assertTokenRejected()
+
+    def test_delete_account(self):
+        self.assertEqual(self.client.delete('/profile/').status_code, 204)
+        self.assertTokenRejected()
+
+
+class AsyncViewTests(FridgeFixtures, APITransactionTestCase):
+    # Transactional, so that the thread pool running the async views sees the fixtures.
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.user).key
+        for _ in range(5):
+            self.create_recipe()
+
+    def async_get(self, url, token=None):
+        headers = {'AUTHORIZATION': 'Token {}'.format(token)} if token else {}
+        return async_to_sync(self.async_client.get)(url, **headers)
+
+    def assertSameProducts(self, async_url, sync_url):
+        response = self.async_get(async_url, self.token)
+        self.assertEqual(response.status_code, 200)
+        async_products = sorted(json.loads(response.content), key=lambda product: product['id'])
+        sync_products = sorted(json.loads(self.client.get(sync_url).content), key=lambda product: product['id'])
+        self.assertEqual(async_products, sync_products)
+
+    def test_authentication(self):
+        url = '/async/fridge/{}/'.format(self.fridge.id)
+        self.assertEqual(self.async_get(url).status_code, 401)
+        self.assertEqual(self.async_get(url, 'invalid').status_code, 401)
+        self.assertEqual(self.async_get(url, self.token).status_code, 200)
+
+    def test_fridge_products_match_sync_view(self):
+        self.assertSameProducts('/async/fridge/{}/'.format(self.fridge.id), '/fridge/{}/'.format(self.fridge.id))
+
+    def test_notification_matches_sync_view(self):
+        self.assertSameProducts('/async/notification/{}?days=1'.format(self.fridge.id),
+                                '/notification/{}?days=1'.format(self.fridge.id))
+
+    def test_recipe_pages_match_sync_view(self):
+        async_url = '/async/recipes/?page_size=2&order=na'
+        sync_url = '/recipes/?pagination=cursor&page_size=2&order=na'
+        pages = 0
+        while async_url:
+            async_page = json.loads(self.async_get(async_url, self.token).content)
+            sync_page = json.loads(self.client.get(sync_url).content)
+            self.assertEqual(async_page['results'], sync_page['results'])
+            async_url, sync_url = async_page['next'], sync_page['next']
+            pages += 1
+        self.assertIsNone(sync_url)
+        self.assertEqual(pages, 3)
+
+
+@override_settings(PROFILING_QUERY_HEADER=True)
+class ProfilingMiddlewareTests(FridgeFixtures, APITransactionTestCase):
+    # Transactional, so that the thread pool running the async views sees the fixtures.
+    def test_sync_query_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/fridge/{}/'.format(self.fridge.id))
+        self.assertEqual(response['X-Query-Count'], str(len(context.captured_queries)))
+
+    def test_async_queries_are_counted(self):
+        token = Token.objects.create(user=self.user)
+        response = async_to_sync(self.async_client.get)('/async/fridge/{}/'.format(self.fridge.id),
+                                                         AUTHORIZATION='Token {}'.format(token.key))
+        self.assertEqual(response.status_code, 200)
+        # Authentication and the product query run in a thread pool worker, off the middleware's thread.
+        self.assertGreaterEqual(int(response['X-Query-Count']), 2)
+
+    @override_settings(PROFILING_QUERY_HEADER=False)
+    def test_header_is_opt_in(self):
+        self.assertNotIn('X-Query-Count', self.client.get('/fridge/{}/'.format(self.fridge.id)))
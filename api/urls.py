@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from . import views
+from . import async_views, views
 
 router = routers.DefaultRouter()
 router.register(r'products', views.ProductViewSet)
@@ -20,14 +20,24 @@ urlpatterns = [
     path('profile/fridges/', views.CurrentUserFridges.as_view()),
     path('profile/recipes/', views.CurrentUserRecipes.as_view()),
     path('profile/comments/', views.CurrentUserComments.as_view()),
+    path('profile/products/export/', views.CurrentUserProductsExport.as_view()),
+    path('profile/waste/', views.CurrentUserWaste.as_view()),
     path('profile/changepassword', views.ChangePasswordView.as_view()),
     path('profile/ratings/<int:recipe_id>/', views.RatingForUserViewSet.as_view()),
     path('profile/recommend/<int:fridge_id>', views.RecommendationsForFridgeViewSet.as_view()),
     path('profile/urgent/<int:fridge_id>', views.UrgentRecommendationsForFridgeViewSet.as_view()),
+    path('profile/scored/<int:fridge_id>', views.ScoredRecommendationsForFridgeViewSet.as_view()),
+    path('profile/nutrition/<int:fridge_id>', views.FridgeNutritionView.as_view()),
     path('register/', views.UserCreate.as_view()),
     path('login/', views.CustomAuthToken.as_view()),
     path('logout/', views.Logout.as_view()),
     path('fridge/<int:fridge_id>/', views.FridgeProductViewSet.as_view()),
     path('notification/<int:fridge_id>', views.Notification.as_view()),
+    path('mail/metrics/', views.MailQueueMetrics.as_view()),
+    path('recommendations/metrics/', views.RecommendationCacheMetrics.as_view()),
+    path('metrics/', views.Metrics.as_view()),
+    path('async/recipes/', async_views.recipes),
+    path('async/fridge/<int:fridge_id>/', async_views.fridge_products),
+    path('async/notification/<int:fridge_id>', async_views.notification),
     path(r'password-reset/', include('django_rest_resetpassword.urls', namespace='password_reset'))
 ]
@@ -1,22 +1,38 @@
+from collections import Counter
 from functools import reduce
-from itertools import combinations
-import datetime
+from itertools import chain, combinations
 
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import JsonResponse, HttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, mixins, generics, status
+from rest_framework.decorators import action
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Count, Avg, FloatField, F, Sum, Q
-from django.db.models.functions import Coalesce, Cast
+from django.db.models import F, Prefetch
 
-from .models import Product, Fridge, Recipe, Comment, Rating, Ingredient
+from .models import Product, Fridge, Recipe, Comment, Rating, Ingredient, RecipeIngredient, DailyRollup, \
+    FridgeNutrition, ArchivedProduct
 from .serializers import ProductSerializer, UserSerializer, FridgeSerializer, UserCreateSerializer, \
-    ChangePasswordSerializer, RecipeSerializer, CommentSerializer, RatingSerializer, IngredientSerializer
+    ChangePasswordSerializer, RecipeSerializer, CommentSerializer, RatingSerializer, IngredientSerializer, \
+    BulkProductSerializer, ScoredRecipeSerializer
+from .cache import cached_recommendations, recommendation_cache_stats, \
+    fridge_version_key, user_fridges_version_key, recipe_version_key, RECIPES_VERSION_KEY
+from .conditional import ConditionalGetMixin
+from .exports import stream_export, get_export_format
+from .filters import RecipeQuery, annotate_recipe_stats
+from .lifecycle import fridges_changed, waste_trends
+from .mail import queue_metrics
+from .metrics import registry, gauge
+from .pagination import KeysetPaginationMixin
+from .scoring import score_fridge
+from .search import search_ingredients
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -25,9 +41,22 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 1000
 
 
+def prefetch_ids(lookup, model, foreign_key):
+    # Loads only the ids needed by a PrimaryKeyRelatedField(many=True) in one extra query per page.
+    return Prefetch(lookup, queryset=model.objects.only('id', foreign_key))
+
+
+def get_expiry_days(request, default=3):
+    days = request.query_params.get('days', default)
+    try:
+        return int(days)
+    except ValueError:
+        raise ValidationError({'days': 'A valid integer is required.'})
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAdminUser,)
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related(prefetch_ids('fridges', Fridge, 'user_id'))
     serializer_class = UserSerializer
 
 
@@ -70,14 +99,16 @@ class ChangePasswordView(generics.UpdateAPIView):
         return Response({'token': token.key}, status=status.HTTP_200_OK)
 
 
-class CurrentUserFridges(generics.ListAPIView, mixins.CreateModelMixin):
+class CurrentUserFridges(ConditionalGetMixin, generics.ListAPIView, mixins.CreateModelMixin):
     permission_classes = (IsAuthenticated,)
     serializer_class = FridgeSerializer
 
+    def get_version_keys(self):
+        return [user_fridges_version_key(self.request.user.id)]
+
     def get_queryset(self):
         user = self.request.user
-        print(user)
-        return Fridge.objects.filter(user_id=user)
+        return Fridge.objects.filter(user_id=user).prefetch_related(prefetch_ids('products', Product, 'fridge_id'))
 
     def post(self, request, *args, **kwargs):
         request.data._mutable = True
@@ -91,7 +122,7 @@ class CurrentUserRecipes(generics.ListAPIView, mixins.CreateModelMixin):
 
     def get_queryset(self):
         user = self.request.user
-        return Recipe.objects.filter(user_id=user)
+        return Recipe.objects.filter(user_id=user).prefetch_related(prefetch_ids('comments', Comment, 'recipe_id'))
 
     def post(self, request, *args, **kwargs):
         request.data['user_id'] = self.request.user.id
@@ -115,6 +146,67 @@ class ProductViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated,)
     queryset = Product.objects.all().order_by('product_name')
     serializer_class = ProductSerializer
+    max_bulk_size = 1000
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of products.']})
+        if len(request.data) > self.max_bulk_size:
+            raise ValidationError({'non_field_errors': ['At most {} products per request.'.format(self.max_bulk_size)]})
+
+        errors = []
+        items = []
+        for index, data in enumerate(request.data):
+            serializer = BulkProductSerializer(data=data)
+            if serializer.is_valid():
+                items.append((index, dict(serializer.validated_data)))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        fridges = Fridge.objects.filter(user_id=request.user).in_bulk({data['fridge_id'] for index, data in items})
+        existing = Product.objects.filter(fridge_id__user_id=request.user).in_bulk(
+            {data['id'] for index, data in items if 'id' in data})
+        created, updated = [], []
+        seen = set()
+        for index, data in items:
+            fridge = fridges.get(data.pop('fridge_id'))
+            if fridge is None:
+                errors.append({'index': index, 'errors': {'fridge_id': ['Invalid pk - object does not exist.']}})
+            elif 'id' not in data:
+                created.append(Product(fridge_id=fridge, **data))
+            elif data['id'] in seen:
+                errors.append({'index': index, 'errors': {'id': ['Product already updated by an earlier item.']}})
+            elif data['id'] in existing:
+                seen.add(data['id'])
+                product = existing[data.pop('id')]
+                for field, value in data.items():
+                    setattr(product, field, value)
+                product.fridge_id = fridge
+                updated.append(product)
+            else:
+                errors.append({'index': index, 'errors': {'id': ['Invalid pk - object does not exist.']}})
+        if errors:
+            return Response({'errors': sorted(errors, key=lambda error: error['index'])},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            Product.objects.bulk_create(created, batch_size=500)
+            fields = [field for field in BulkProductSerializer.Meta.fields if field != 'id']
+            Product.objects.bulk_update(updated, fields, batch_size=500)
+        # bulk_create/bulk_update bypass the post_save signals.
+        fridges_changed(*{product.fridge_id_id for product in created + updated} |
+                        {product._saved_fridge_id for product in updated})
+        days = Counter(timezone.localdate(product.date_added) for product in created)
+        for product in updated:
+            day = timezone.localdate(product.date_added)
+            if product._rollup_day != day:
+                days[product._rollup_day] -= 1
+                days[day] += 1
+        DailyRollup.add_many('products', days)
+        return Response({'created': ProductSerializer(created, many=True).data,
+                         'updated': ProductSerializer(updated, many=True).data},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
 class IngredientViewSet(viewsets.ModelViewSet):
@@ -126,55 +218,35 @@ class IngredientViewSet(viewsets.ModelViewSet):
         queryset = Ingredient.objects.all().order_by('ingredient_name')
         ingredient = self.request.query_params.get('ingredient', None)
         if ingredient is not None:
-            ingredient = ingredient.lower()
-            queryset = queryset.filter(ingredient_name__contains=ingredient)
+            prefix = self.request.query_params.get('mode', None) == 'prefix'
+            queryset = search_ingredients(queryset, ingredient, prefix=prefix)
         return queryset
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, KeysetPaginationMixin, viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated,)
     queryset = Recipe.objects.all().order_by('recipe_name')
     serializer_class = RecipeSerializer
     pagination_class = StandardResultsSetPagination
 
+    def get_version_keys(self):
+        if self.action == 'retrieve':
+            return [recipe_version_key(self.kwargs['pk'])]
+        return [RECIPES_VERSION_KEY]
+
     def get_queryset(self):
-        recipe_name = self.request.query_params.get('name', None)
-        ingredients = self.request.query_params.get('ingredients', None)
-        tags = self.request.query_params.get('tags', None)
-        difficulty = self.request.query_params.get('difficulty', None)
-        meal = self.request.query_params.get('meal', None)
-        order = self.request.query_params.get('order', None)
-        order_dict = {'pp': '-popularity', 'na': 'recipe_name', 'nd': '-recipe_name', 'ra': 'rating', 'rd': '-rating',
-                      'pa': 'ratings_num', 'pd': '-ratings_num', 'ta': 'prep_time', 'td': '-prep_time'}
-        queryset = Recipe.objects.annotate(
-            ratings_num=Count('ratings'),
-            rating=Coalesce(Avg('ratings__rating'), 0),
-            popularity=Cast(Count('ratings'), FloatField()) * Cast(Coalesce(Avg('ratings__rating'), 1) ** 2,
-                                                                FloatField()) + (
-                               Cast(Count('comments'), FloatField()) - Cast('ratings_num', FloatField()))
-        )
-        if recipe_name is not None:
-            queryset = queryset.filter(recipe_name__icontains=recipe_name)
-        if ingredients is not None:
-            queryset = queryset.filter(ingredients__contains=ingredients)
-        if tags is not None:
-            queryset = queryset.filter(tags__contains=tags)
-        if difficulty is not None:
-            queryset = queryset.filter(difficulty__contains=difficulty)
-        if meal is not None:
-            queryset = queryset.filter(meal__contains=meal)
-        if order is not None:
-            if order in order_dict:
-                queryset = queryset.order_by(order_dict.get(order))
-            else:
-                queryset = queryset.order_by(order_dict.get('pp'))
-        else:
-            queryset = queryset.order_by(order_dict.get('pp'))
+        queryset = RecipeQuery.from_request(self.request).apply(Recipe.objects.all())
+        return queryset.prefetch_related(prefetch_ids('comments', Comment, 'recipe_id'))
 
-        return queryset
+    @action(detail=False)
+    def export(self, request):
+        queryset = annotate_recipe_stats(Recipe.objects.all()).annotate(comments_num=F('stats__comments_num'))
+        fields = ['id', 'recipe_name', 'difficulty', 'meal', 'prep_time', 'tags', 'ingredients', 'ratings_num',
+                  'rating', 'comments_num', 'popularity']
+        return stream_export(queryset.order_by('id'), fields, get_export_format(request), 'recipes')
 
 
-class RecommendationsForFridgeViewSet(generics.ListAPIView):
+class RecommendationsForFridgeViewSet(KeysetPaginationMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
@@ -182,59 +254,23 @@ class RecommendationsForFridgeViewSet(generics.ListAPIView):
 
     def get_queryset(self):
         f_id = self.kwargs['fridge_id']
-        fridge_ingredients = Product.objects.filter(fridge_id=f_id).values_list('category', flat=True)
-        recipes = Recipe.objects.all()
-        recommendations = set()
-        for recipe in recipes:
-            num_of_ingredients = len(recipe.ingredients)
-            required_ingredients = round(0.7 * num_of_ingredients)
-            present_ingredients = 0
-            recipe_ingredients = [row[0] for row in recipe.ingredients]
-            for ingredient in fridge_ingredients:
-                if ingredient in recipe_ingredients:
-                    present_ingredients += 1
-            if present_ingredients >= required_ingredients:
-                recommendations.add(recipe.id)
-
-        queryset = recipes.filter(id__in=recommendations)
-
-        recipe_name = self.request.query_params.get('name', None)
-        ingredients = self.request.query_params.get('ingredients', None)
-        tags = self.request.query_params.get('tags', None)
-        difficulty = self.request.query_params.get('difficulty', None)
-        meal = self.request.query_params.get('meal', None)
-        order = self.request.query_params.get('order', None)
-        order_dict = {'pp': '-popularity', 'na': 'recipe_name', 'nd': '-recipe_name', 'ra': 'rating', 'rd': '-rating',
-                      'pa': 'ratings_num', 'pd': '-ratings_num', 'ta': 'prep_time', 'td': '-prep_time'}
-        queryset = queryset.annotate(
-            ratings_num=Count('ratings'),
-            rating=Coalesce(Avg('ratings__rating'), 0),
-            popularity=Cast(Count('ratings'), FloatField()) * Cast(Coalesce(Avg('ratings__rating'), 1) ** 2,
-                                                                FloatField()) + (
-                               Cast(Count('comments'), FloatField()) - Cast('ratings_num', FloatField()))
-        )
-        if recipe_name is not None:
-            queryset = queryset.filter(recipe_name__icontains=recipe_name)
-        if ingredients is not None:
-            queryset = queryset.filter(ingredients__contains=ingredients)
-        if tags is not None:
-            queryset = queryset.filter(tags__contains=tags)
-        if difficulty is not None:
-            queryset = queryset.filter(difficulty__contains=difficulty)
-        if meal is not None:
-            queryset = queryset.filter(meal__contains=meal)
-        if order is not None:
-            if order in order_dict:
-                queryset = queryset.order_by(order_dict.get(order))
-            else:
-                queryset = queryset.order_by(order_dict.get('pp'))
-        else:
-            queryset = queryset.order_by(order_dict.get('pp'))
+        recommendations = cached_recommendations('all', f_id, lambda: self.match(f_id))
+        queryset = Recipe.objects.filter(id__in=recommendations)
+        queryset = RecipeQuery.from_request(self.request).apply(queryset)
+        return queryset.prefetch_related(prefetch_ids('comments', Comment, 'recipe_id'))
 
-        return queryset
+    @staticmethod
+    def match(f_id):
+        fridge_ingredients = Product.objects.filter(fridge_id=f_id).values_list('category', flat=True)
+        recommendations = set(Recipe.objects.filter(ingredients_num=0).values_list('id', flat=True))
+        for hit in RecipeIngredient.recipe_hits(fridge_ingredients):
+            required_ingredients = round(0.7 * hit['recipe_id__ingredients_num'])
+            if hit['hits'] >= required_ingredients:
+                recommendations.add(hit['recipe_id'])
+        return recommendations
 
 
-class UrgentRecommendationsForFridgeViewSet(generics.ListAPIView):
+class UrgentRecommendationsForFridgeViewSet(KeysetPaginationMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
@@ -242,66 +278,49 @@ class UrgentRecommendationsForFridgeViewSet(generics.ListAPIView):
 
     def get_queryset(self):
         f_id = self.kwargs['fridge_id']
-        fridge_ingredients = Product.objects.filter(fridge_id=f_id)
-        expiring_ingredients = list()
-
-        for ingredient in fridge_ingredients:
-            expiration_date = ingredient.expiration_date
-            diff = expiration_date.date() - datetime.date.today()
-            if diff.days < 3:
-                expiring_ingredients.append(ingredient.category)
-        if not expiring_ingredients:
+        days = get_expiry_days(self.request)
+        recommendations = cached_recommendations('urgent', f_id, lambda: self.match(f_id, days),
+                                                 days, timezone.localdate())
+        if not recommendations:
             return Recipe.objects.none()
 
-        recipes = Recipe.objects.all()
+        queryset = Recipe.objects.filter(id__in=recommendations)
+        queryset = RecipeQuery.from_request(self.request).apply(queryset)
+        return queryset.prefetch_related(prefetch_ids('comments', Comment, 'recipe_id'))
+
+    @staticmethod
+    def match(f_id, days):
+        expiring_ingredients = set(Product.objects.filter(fridge_id=f_id)
+                                   .expiring_within(days)
+                                   .values_list('category', flat=True))
+        if not expiring_ingredients:
+            return set()
+
         recommendations = set()
-        for recipe in recipes:
-            num_of_ingredients = len(expiring_ingredients)
-            required_ingredients = round(0.7 * num_of_ingredients)
-            present_ingredients = 0
-            recipe_ingredients = [row[0] for row in recipe.ingredients]
-            for ingredient in expiring_ingredients:
-                if ingredient in recipe_ingredients:
-                    present_ingredients += 1
-            if present_ingredients >= required_ingredients:
-                recommendations.add(recipe.id)
-
-        queryset = recipes.filter(id__in=recommendations)
-
-        recipe_name = self.request.query_params.get('name', None)
-        ingredients = self.request.query_params.get('ingredients', None)
-        tags = self.request.query_params.get('tags', None)
-        difficulty = self.request.query_params.get('difficulty', None)
-        meal = self.request.query_params.get('meal', None)
-        order = self.request.query_params.get('order', None)
-        order_dict = {'pp': '-popularity', 'na': 'recipe_name', 'nd': '-recipe_name', 'ra': 'rating', 'rd': '-rating',
-                      'pa': 'ratings_num', 'pd': '-ratings_num', 'ta': 'prep_time', 'td': '-prep_time'}
-        queryset = queryset.annotate(
-            ratings_num=Count('ratings'),
-            rating=Coalesce(Avg('ratings__rating'), 0),
-            popularity=Cast(Count('ratings'), FloatField()) * Cast(Coalesce(Avg('ratings__rating'), 1) ** 2,
-                                                                FloatField()) + (
-                               Cast(Count('comments'), FloatField()) - Cast('ratings_num', FloatField()))
-        )
-        if recipe_name is not None:
-            queryset = queryset.filter(recipe_name__icontains=recipe_name)
-        if ingredients is not None:
-            queryset = queryset.filter(ingredients__contains=ingredients)
-        if tags is not None:
-            queryset = queryset.filter(tags__contains=tags)
-        if difficulty is not None:
-            queryset = queryset.filter(difficulty__contains=difficulty)
-        if meal is not None:
-            queryset = queryset.filter(meal__contains=meal)
-        if order is not None:
-            if order in order_dict:
-                queryset = queryset.order_by(order_dict.get(order))
-            else:
-                queryset = queryset.order_by(order_dict.get('pp'))
-        else:
-            queryset = queryset.order_by(order_dict.get('pp'))
+        required_ingredients = round(0.7 * len(expiring_ingredients))
+        for hit in RecipeIngredient.recipe_hits(expiring_ingredients):
+            if hit['hits'] >= required_ingredients:
+                recommendations.add(hit['recipe_id'])
+        return recommendations
 
-        return queryset
+
+class ScoredRecommendationsForFridgeViewSet(generics.ListAPIView):
+    permission_classes = (IsAuthenticated,)
+    queryset = Recipe.objects.all()
+    serializer_class = ScoredRecipeSerializer
+    pagination_class = StandardResultsSetPagination
+
+    def list(self, request, *args, **kwargs):
+        ranking = self.paginate_queryset(score_fridge(self.kwargs['fridge_id']))
+        queryset = annotate_recipe_stats(Recipe.objects.filter(id__in=[row[0] for row in ranking]))
+        recipes = queryset.prefetch_related(prefetch_ids('comments', Comment, 'recipe_id')).in_bulk()
+        page = []
+        for recipe_id, score, coverage, missing in ranking:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.score, recipe.coverage, recipe.missing_ingredients = score, coverage, missing
+                page.append(recipe)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 
 class RatingViewSet(viewsets.ModelViewSet):
@@ -331,18 +350,77 @@ class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
 
 
-class FridgeProductViewSet(generics.ListAPIView):
+class FridgeProductViewSet(ConditionalGetMixin, generics.ListAPIView):
+    """Live products of a fridge; ``?include_archived=1`` appends the archived ones."""
     permission_classes = (IsAuthenticated,)
     serializer_class = ProductSerializer
 
+    def get_version_keys(self):
+        return [fridge_version_key(self.kwargs['fridge_id'])]
+
     def get_queryset(self):
         f_id = self.kwargs['fridge_id']
         return Product.objects.filter(fridge_id=f_id)
 
+    def filter_queryset(self, queryset):
+        if self.request.query_params.get('include_archived') not in ('1', 'true'):
+            return queryset
+        archived = ArchivedProduct.objects.filter(fridge_id=self.kwargs['fridge_id']).order_by('date_added')
+        return list(chain(queryset, archived))
+
+
+class FridgeNutritionView(ConditionalGetMixin, APIView):
+    """
+    Nutrient totals of a fridge, overall and per product category. Served from the
+    FridgeNutrition summary row kept up to date on product writes; ``?live=1``
+    aggregates the products instead.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get_version_keys(self):
+        return [fridge_version_key(self.kwargs['fridge_id'])]
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(self.summary, request, *args, **kwargs)
+
+    def summary(self, request, fridge_id, format=None):
+        if not Fridge.objects.filter(id=fridge_id, user_id=request.user).exists():
+            raise NotFound()
+        if request.query_params.get('live') in ('1', 'true'):
+            summary = dict(Product.objects.filter(fridge_id=fridge_id).nutrition(), updated_at=timezone.now())
+        else:
+            nutrition = FridgeNutrition.objects.filter(fridge_id=fridge_id).first() or \
+                        FridgeNutrition.refresh(fridge_id)
+            summary = {'totals': nutrition.totals, 'categories': nutrition.categories,
+                       'updated_at': nutrition.updated_at}
+        return Response(dict(summary, fridge_id=fridge_id))
+
+
+class CurrentUserWaste(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, format=None):
+        weeks = request.query_params.get('weeks', 12)
+        try:
+            weeks = int(weeks)
+        except ValueError:
+            raise ValidationError({'weeks': 'A valid integer is required.'})
+        if not 0 < weeks <= 520:
+            raise ValidationError({'weeks': 'Ensure this value is between 1 and 520.'})
+        return Response(waste_trends(request.user, weeks))
+
+
+class CurrentUserProductsExport(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, format=None):
+        queryset = Product.objects.filter(fridge_id__user_id=request.user).order_by('fridge_id', 'id')
+        return stream_export(queryset, ProductSerializer.Meta.fields, get_export_format(request), 'products')
+
 
 class FridgeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated,)
-    queryset = Fridge.objects.all().order_by('fridge_name')
+    queryset = Fridge.objects.prefetch_related(prefetch_ids('products', Product, 'fridge_id')).order_by('fridge_name')
     serializer_class = FridgeSerializer
 
 
@@ -369,20 +447,47 @@ class Logout(APIView):
         return JsonResponse({'message': 'Logged out correctly'}, status=200)
 
 
-class Notification(generics.ListAPIView):
+class Notification(ConditionalGetMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = ProductSerializer
 
+    def get_version_keys(self):
+        return [fridge_version_key(self.kwargs['fridge_id'])]
+
+    def get_etag_parts(self):
+        return [timezone.localdate()]
+
     def get_queryset(self):
         f_id = self.kwargs['fridge_id']
-        expiring_ingredients = set()
-        fridge_ingredients = Product.objects.filter(fridge_id=f_id)
-        for ingredient in fridge_ingredients:
-            expiration_date = ingredient.expiration_date
-            diff = expiration_date.date() - datetime.date.today()
-            if diff.days < 3:
-                expiring_ingredients.add(ingredient.id)
-        if not expiring_ingredients:
-            return Recipe.objects.none()
-        queryset = Product.objects.all().filter(id__in=expiring_ingredients)
-        return queryset
\ No newline at end of file
+        return (Product.objects.filter(fridge_id=f_id)
+                .expiring_within(get_expiry_days(self.request))
+                .order_by('expiration_date'))
+
+
+class MailQueueMetrics(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response(queue_metrics())
+
+
+class RecommendationCacheMetrics(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response(recommendation_cache_stats())
+
+
+class Metrics(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        lines = registry.render()
+        mail = queue_metrics()
+        lines += gauge('wasteless_mail_queue_depth', 'Outbound emails waiting to be sent.', mail['queued'])
+        lines += gauge('wasteless_mail_queue_failed', 'Outbound emails that ran out of retries.', mail['failed'])
+        cache_stats = recommendation_cache_stats()
+        lines += gauge('wasteless_recommendation_cache_hits', 'Recommendation cache hits.', cache_stats['hits'])
+        lines += gauge('wasteless_recommendation_cache_misses', 'Recommendation cache misses.',
+                       cache_stats['misses'])
+        return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')